@@ -0,0 +1,71 @@
+import codecs
+from collections import OrderedDict
+import os
+import sys
+from time import time
+import timeit
+
+# compares per-sample cost of UmInterface.parse with the previous hex string based parser,
+# run from the application directory: python benchmark-um-parse.py [number of samples]
+
+from interfaces.um import UmInterface
+
+
+def parse_hex(interface, data):
+    if len(data) < 130:
+        return None
+
+    data = codecs.encode(data, "hex").decode("utf-8")
+
+    result = OrderedDict()
+
+    multiplier = 10 if interface.higher_resolution else 1
+
+    result["timestamp"] = time()
+    result["voltage"] = int("0x" + data[4] + data[5] + data[6] + data[7], 0) / (100 * multiplier)
+    result["current"] = int("0x" + data[8] + data[9] + data[10] + data[11], 0) / (1000 * multiplier)
+    result["power"] = int("0x" + data[12] + data[13] + data[14] + data[15] + data[16] +
+                          data[17] + data[18] + data[19], 0) / 1000
+    result["temperature"] = int("0x" + data[20] + data[21] + data[22] + data[23], 0)
+    result["data_plus"] = int("0x" + data[192] + data[193] + data[194] + data[195], 0) / 100
+    result["data_minus"] = int("0x" + data[196] + data[197] + data[198] + data[199], 0) / 100
+    result["mode_id"] = int("0x" + data[200] + data[201] + data[202] + data[203], 0)
+    result["mode_name"] = None
+    result["accumulated_current"] = int("0x" + data[204] + data[205] + data[206] + data[207] + data[208] +
+                                        data[209] + data[210] + data[211], 0)
+    result["accumulated_power"] = int("0x" + data[212] + data[213] + data[214] + data[215] + data[216] +
+                                      data[217] + data[218] + data[219], 0)
+    result["accumulated_time"] = int("0x" + data[224] + data[225] + data[226] + data[227] + data[228] +
+                                     data[229] + data[230] + data[231], 0)
+    result["resistance"] = int("0x" + data[244] + data[245] + data[246] + data[247] + data[248] +
+                               data[249] + data[250] + data[251], 0) / 10
+
+    if result["mode_id"] in interface.modes:
+        result["mode_name"] = interface.modes[result["mode_id"]]
+
+    return result
+
+
+def without_timestamp(result):
+    result = dict(result)
+    del result["timestamp"]
+    return result
+
+
+if __name__ == "__main__":
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    samples = [os.urandom(130) for _ in range(100)]
+
+    for higher_resolution in [False, True]:
+        interface = UmInterface(None, None)
+        interface.higher_resolution = higher_resolution
+
+        for sample in samples:
+            if without_timestamp(parse_hex(interface, sample)) != without_timestamp(interface.parse(sample)):
+                raise AssertionError("parsers differ for sample %s" % sample.hex())
+
+        before = timeit.timeit(lambda: parse_hex(interface, samples[0]), number=number) / number
+        after = timeit.timeit(lambda: interface.parse(samples[0]), number=number) / number
+        print("higher resolution: %s, hex: %.2f us, struct: %.2f us, speedup: %.1fx" % (
+            higher_resolution, before * 1e6, after * 1e6, before / after
+        ))
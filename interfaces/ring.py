@@ -0,0 +1,161 @@
+from multiprocessing import Event
+from multiprocessing.shared_memory import SharedMemory
+import struct
+
+
+class SampleRing:
+    """
+    Single producer, single consumer ring buffer of fixed-layout samples in shared memory,
+    written by device process and read by Daemon without any serialization
+    """
+    CAPACITY = 4096
+
+    fields = [
+        "timestamp", "voltage", "current", "power", "temperature", "data_plus", "data_minus", "mode_id",
+        "accumulated_current", "accumulated_power", "accumulated_time", "resistance",
+    ]
+    # written count, stopped flag
+    header = struct.Struct("<QQ")
+    # sampling statistics of producer, see TickScheduler.stats
+    stats_fields = ["ticks", "missed", "late", "jitter_mean", "jitter_max", "jitter_deviation"]
+    stats_layout = struct.Struct("<3Q3d")
+    # bitmask of None values, bitmask of integer values, numeric fields, mode name
+    record = struct.Struct("<QQ%sd24s" % len(fields))
+    mode_name_bit = 1 << len(fields)
+
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.offset = self.header.size + self.stats_layout.size
+        self.memory = SharedMemory(create=True, size=self.offset + self.record.size * capacity)
+        self.owner = True
+        self.available = Event()
+        self.read = 0
+        self.dropped = 0
+        self.header.pack_into(self.memory.buf, 0, 0, 0)
+        self.stats_layout.pack_into(self.memory.buf, self.header.size, 0, 0, 0, 0.0, 0.0, 0.0)
+
+    def __getstate__(self):
+        return {
+            "name": self.memory.name,
+            "capacity": self.capacity,
+            "available": self.available,
+        }
+
+    def __setstate__(self, state):
+        self.capacity = state["capacity"]
+        self.offset = self.header.size + self.stats_layout.size
+        self.available = state["available"]
+        self.memory = SharedMemory(state["name"])
+        self.owner = False
+        self.read = self.header.unpack_from(self.memory.buf, 0)[0]
+        self.dropped = 0
+
+    def put(self, data):
+        none = 0
+        integers = 0
+        values = []
+        for index, field in enumerate(self.fields):
+            value = data.get(field)
+            if value is None:
+                none |= 1 << index
+                value = 0
+            elif isinstance(value, int):
+                integers |= 1 << index
+            values.append(value)
+
+        mode_name = data.get("mode_name")
+        if mode_name is None:
+            none |= self.mode_name_bit
+            mode_name = b""
+        else:
+            mode_name = mode_name.encode("utf-8")
+
+        written = self.header.unpack_from(self.memory.buf, 0)[0]
+        offset = self.offset + (written % self.capacity) * self.record.size
+        self.record.pack_into(self.memory.buf, offset, none, integers, *values, mode_name)
+        struct.pack_into("<Q", self.memory.buf, 0, written + 1)
+        self.available.set()
+
+    def get(self, timeout):
+        """
+        Next sample or None if nothing arrived within timeout (or consumer was woken up by stop/error)
+        """
+        sample = self.next()
+        if sample is None:
+            self.available.clear()
+            sample = self.next()
+            if sample is None:
+                self.available.wait(timeout)
+                sample = self.next()
+        return sample
+
+    def next(self):
+        while True:
+            written = self.header.unpack_from(self.memory.buf, 0)[0]
+            if written <= self.read:
+                return None
+
+            # slot at written % capacity is the one producer writes next, it is never read
+            if written - self.read >= self.capacity:
+                self.dropped += written - self.read - self.capacity + 1
+                self.read = written - self.capacity + 1
+
+            offset = self.offset + (self.read % self.capacity) * self.record.size
+            values = self.record.unpack_from(self.memory.buf, offset)
+
+            # slot could be overwritten while it was read by very fast producer
+            written = self.header.unpack_from(self.memory.buf, 0)[0]
+            if written - self.read >= self.capacity:
+                continue
+
+            self.read += 1
+            return self.decode(values)
+
+    def decode(self, values):
+        none, integers = values[0], values[1]
+        sample = {}
+        for index, field in enumerate(self.fields):
+            bit = 1 << index
+            if none & bit:
+                sample[field] = None
+            elif integers & bit:
+                sample[field] = int(values[index + 2])
+            else:
+                sample[field] = values[index + 2]
+
+        if none & self.mode_name_bit:
+            sample["mode_name"] = None
+        else:
+            sample["mode_name"] = values[-1].rstrip(b"\0").decode("utf-8", "replace")
+
+        return sample
+
+    def put_stats(self, stats):
+        self.stats_layout.pack_into(
+            self.memory.buf, self.header.size, *[stats[field] for field in self.stats_fields]
+        )
+
+    def get_stats(self):
+        return dict(zip(self.stats_fields, self.stats_layout.unpack_from(self.memory.buf, self.header.size)))
+
+    def skip(self):
+        self.read = self.header.unpack_from(self.memory.buf, 0)[0]
+
+    def start(self):
+        struct.pack_into("<Q", self.memory.buf, 8, 0)
+
+    def stop(self):
+        struct.pack_into("<Q", self.memory.buf, 8, 1)
+        self.available.set()
+
+    def wake(self):
+        self.available.set()
+
+    def stopped(self):
+        return self.header.unpack_from(self.memory.buf, 0)[1] == 1
+
+    def close(self):
+        self.memory.close()
+        if self.owner:
+            self.owner = False
+            self.memory.unlink()
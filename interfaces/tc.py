@@ -1,7 +1,8 @@
 import asyncio
 import logging
 import struct
-from time import time, sleep
+from threading import Event
+from time import time
 
 from Crypto.Cipher import AES
 
@@ -31,10 +32,13 @@ class TcBleInterface(Interface):
     loop = None
     bound = False
     addresses_index = 0
+    completed = None
 
     def __init__(self, address):
         self.address = address
         self.response = Response()
+        self.idle = Event()
+        self.idle.set()
 
     def scan(self):
         async def run():
@@ -47,10 +51,10 @@ class TcBleInterface(Interface):
                 })
             return formatted
 
-        return self.get_loop().run_until_complete(run())
+        return self.run(run())
 
     def connect(self):
-        self.get_loop().run_until_complete(self._connect_run(self.address))
+        self.run(self._connect_run(self.address))
 
     async def _connect_run(self, address):
         if not supported:
@@ -60,14 +64,11 @@ class TcBleInterface(Interface):
         await self.client.connect()
 
     def disconnect(self):
-        expiration = time() + self.timeout
-        while self.loop and self.loop.is_running() and time() <= expiration:
-            sleep(0.1)
-
-        sleep(1)
+        # operation started from other thread has to finish first
+        self.idle.wait(self.timeout)
 
         try:
-            self.get_loop().run_until_complete(self._close_run())
+            self.run(self._close_run())
         except RuntimeError as e:
             if "loop is already running" not in str(e):
                 raise e
@@ -86,10 +87,11 @@ class TcBleInterface(Interface):
             pass
 
     def read(self):
-        return self.get_loop().run_until_complete(self._read_run())
+        return self.run(self._read_run())
 
     async def _read_run(self):
         self.response.reset()
+        self.completed = asyncio.Event()
 
         for retry in range(0, 3):
             address = SERVER_RX_DATA[self.addresses_index]
@@ -98,7 +100,7 @@ class TcBleInterface(Interface):
 
                 if not self.bound:
                     self.bound = True
-                    await self.client.start_notify(SERVER_TX_DATA[self.addresses_index], self.response.callback)
+                    await self.client.start_notify(SERVER_TX_DATA[self.addresses_index], self.callback)
 
             except BleakError as e:
                 message = str(e).lower()
@@ -109,12 +111,11 @@ class TcBleInterface(Interface):
                 else:
                     raise
 
-            expiration = time() + 5
-            while not self.response.is_complete() and time() <= expiration:
-                await asyncio.sleep(0.1)
-
             if not self.response.is_complete():
-                continue
+                try:
+                    await asyncio.wait_for(self.completed.wait(), 5)
+                except asyncio.TimeoutError:
+                    continue
 
             try:
                 return self.response.decode()
@@ -127,6 +128,11 @@ class TcBleInterface(Interface):
 
         return self.response.decode()
 
+    def callback(self, sender, data):
+        self.response.callback(sender, data)
+        if self.completed is not None and self.response.is_complete():
+            self.completed.set()
+
     def encode_command(self, command):
         string = command + "\r\n"
         encoded = string.encode("ascii")
@@ -138,9 +144,22 @@ class TcBleInterface(Interface):
             self.loop = asyncio.new_event_loop()
         return self.loop
 
+    def run(self, coroutine):
+        loop = self.get_loop()
+        if loop.is_running():
+            coroutine.close()
+            raise RuntimeError("This event loop is already running")
+
+        self.idle.clear()
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            self.idle.set()
+
 
 class TcSerialInterface(Interface):
     serial = None
+    record = struct.Struct("<2I")
 
     def __init__(self, port, timeout):
         self.port = port
@@ -160,26 +179,29 @@ class TcSerialInterface(Interface):
         return self.response.decode()
 
     def read_records(self):
+        """
+        Yields recorded measurements, serial port is read in blocks of whatever is already buffered
+        and complete 8-byte records are decoded in place, only incomplete tail is carried over
+        """
         self.send("gtrec")
 
-        results = []
-        buffer = bytearray()
+        remainder = b""
         while True:
-            chunk = self.serial.read(8)
+            chunk = self.serial.read(max(self.serial.in_waiting, self.record.size))
             if len(chunk) == 0:
                 break
 
-            buffer.extend(chunk)
-            if len(buffer) >= 8:
-                record = struct.unpack("<2I", buffer[0:8])
-                buffer = buffer[8:]
+            if remainder:
+                chunk = remainder + chunk
 
-                results.append({
-                    "voltage": float(record[0]) / 1000 / 10,
-                    "current": float(record[1]) / 1000 / 100,
-                })
+            usable = len(chunk) - len(chunk) % self.record.size
+            for voltage, current in self.record.iter_unpack(memoryview(chunk)[:usable]):
+                yield {
+                    "voltage": float(voltage) / 1000 / 10,
+                    "current": float(current) / 1000 / 100,
+                }
 
-        return results
+            remainder = chunk[usable:]
 
     def send(self, value):
         self.open()
@@ -201,8 +223,15 @@ class Response:
         -122, -12, 2, 96, -127, 111, -102, 11,
         -89, -15, 6, 97, -102, -72, 114, -120
     ]
-    buffer = bytearray()
-    index = 0
+    # ECB has no chaining state, so one cipher can be shared by all responses
+    cipher = AES.new(bytes(value & 255 for value in key), AES.MODE_ECB)
+    # little-endian unsigned integers: voltage, current, power (offsets 48-59), resistance,
+    # accumulated mAh, mWh (68-79), temperature sign, temperature, D+, D- (88-103)
+    layout = struct.Struct("<48x3I8x3I8x4I")
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.index = 0
 
     def append(self, data):
         try:
@@ -218,13 +247,8 @@ class Response:
         return self.index >= 192
 
     def decrypt(self):
-        key = []
-        for index, value in enumerate(self.key):
-            key.append(value & 255)
-
-        aes = AES.new(bytes(key), AES.MODE_ECB)
         try:
-            return aes.decrypt(self.buffer)
+            return self.cipher.decrypt(self.buffer)
         except ValueError:
             raise CorruptedResponseException
 
@@ -234,34 +258,32 @@ class Response:
 
         data = self.decrypt()
 
-        if self.decode_integer(data, 88) == 1:
+        (
+            voltage, current, power, resistance, accumulated_current, accumulated_power,
+            temperature_sign, temperature, data_plus, data_minus
+        ) = self.layout.unpack_from(data)
+
+        if temperature_sign == 1:
             temperature_multiplier = -1
         else:
             temperature_multiplier = 1
 
         return {
             "timestamp": time(),
-            "voltage": self.decode_integer(data, 48, 10000),
-            "current": self.decode_integer(data, 52, 100000),
-            "power": self.decode_integer(data, 56, 10000),
-            "resistance": self.decode_integer(data, 68, 10),
-            "accumulated_current": self.decode_integer(data, 72),
-            "accumulated_power": self.decode_integer(data, 76),
+            "voltage": voltage / 10000.0,
+            "current": current / 100000.0,
+            "power": power / 10000.0,
+            "resistance": resistance / 10.0,
+            "accumulated_current": float(accumulated_current),
+            "accumulated_power": float(accumulated_power),
             "accumulated_time": None,
-            "temperature": self.decode_integer(data, 92) * temperature_multiplier,
-            "data_plus": self.decode_integer(data, 96, 100),
-            "data_minus": self.decode_integer(data, 100, 100),
+            "temperature": float(temperature) * temperature_multiplier,
+            "data_plus": data_plus / 100.0,
+            "data_minus": data_minus / 100.0,
             "mode_id": None,
             "mode_name": None
         }
 
-    def decode_integer(self, data, first_byte, divider=1):
-        temp4 = data[first_byte] & 255
-        temp3 = data[first_byte + 1] & 255
-        temp2 = data[first_byte + 2] & 255
-        temp1 = data[first_byte + 3] & 255
-        return ((((temp1 << 24) | (temp2 << 16)) | (temp3 << 8)) | temp4) / float(divider)
-
     def reset(self):
         self.buffer = bytearray()
         self.index = 0
@@ -1,5 +1,5 @@
-import codecs
 from collections import OrderedDict
+import struct
 from time import time
 
 import bluetooth
@@ -23,6 +23,9 @@ class UmInterface(Interface):
         8: "SAMSUNG",
         65535: "Unknown"
     }
+    # big-endian fields of 130 bytes response: voltage, current, power, temperature (offsets 2-11),
+    # D+, D-, mode, accumulated mAh, mWh (offsets 96-109), accumulated time (112), resistance (122)
+    layout = struct.Struct(">2xHHIH84xHHHII2xI6xI")
 
     def __init__(self, port, timeout):
         self.port = port
@@ -49,30 +52,28 @@ class UmInterface(Interface):
         if len(data) < 130:
             return None
 
-        data = codecs.encode(data, "hex").decode("utf-8")
+        (
+            voltage, current, power, temperature, data_plus, data_minus, mode_id,
+            accumulated_current, accumulated_power, accumulated_time, resistance
+        ) = self.layout.unpack_from(data)
 
         result = OrderedDict()
 
         multiplier = 10 if self.higher_resolution else 1
 
         result["timestamp"] = time()
-        result["voltage"] = int("0x" + data[4] + data[5] + data[6] + data[7], 0) / (100 * multiplier)
-        result["current"] = int("0x" + data[8] + data[9] + data[10] + data[11], 0) / (1000 * multiplier)
-        result["power"] = int("0x" + data[12] + data[13] + data[14] + data[15] + data[16] +
-                              data[17] + data[18] + data[19], 0) / 1000
-        result["temperature"] = int("0x" + data[20] + data[21] + data[22] + data[23], 0)
-        result["data_plus"] = int("0x" + data[192] + data[193] + data[194] + data[195], 0) / 100
-        result["data_minus"] = int("0x" + data[196] + data[197] + data[198] + data[199], 0) / 100
-        result["mode_id"] = int("0x" + data[200] + data[201] + data[202] + data[203], 0)
+        result["voltage"] = voltage / (100 * multiplier)
+        result["current"] = current / (1000 * multiplier)
+        result["power"] = power / 1000
+        result["temperature"] = temperature
+        result["data_plus"] = data_plus / 100
+        result["data_minus"] = data_minus / 100
+        result["mode_id"] = mode_id
         result["mode_name"] = None
-        result["accumulated_current"] = int("0x" + data[204] + data[205] + data[206] + data[207] + data[208] +
-                                            data[209] + data[210] + data[211], 0)
-        result["accumulated_power"] = int("0x" + data[212] + data[213] + data[214] + data[215] + data[216] +
-                                          data[217] + data[218] + data[219], 0)
-        result["accumulated_time"] = int("0x" + data[224] + data[225] + data[226] + data[227] + data[228] +
-                                         data[229] + data[230] + data[231], 0)
-        result["resistance"] = int("0x" + data[244] + data[245] + data[246] + data[247] + data[248] +
-                                   data[249] + data[250] + data[251], 0) / 10
+        result["accumulated_current"] = accumulated_current
+        result["accumulated_power"] = accumulated_power
+        result["accumulated_time"] = accumulated_time
+        result["resistance"] = resistance / 10
 
         if result["mode_id"] in self.modes:
             result["mode_name"] = self.modes[result["mode_id"]]
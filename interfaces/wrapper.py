@@ -5,36 +5,47 @@ from time import time
 import traceback
 
 from interfaces.interface import Interface, FatalErrorException
+from interfaces.ring import SampleRing
 from interfaces.tc import TcBleInterface, TcSerialInterface
 from interfaces.um import UmInterface, UmRfcommInterface
 from utils.config import Config, get_args, initialize_paths_from_args
+from utils.scheduler import TickScheduler
 
 
 class Wrapper(Interface):
     listener = None
     process = None
+    interval = None
+    policy = None
 
-    def __init__(self):
+    def __init__(self, profile=None):
+        self.profile = profile
         self.command = Queue()
         self.result = Queue()
+        self.errors = Queue()
+        self.ring = SampleRing()
 
     def run(self):
         if self.process is None or not self.process.is_alive():
-            self.process = Process(target=self._run, args=(self.command, self.result, get_args()))
+            self.process = Process(
+                target=self._run, args=(self.command, self.result, self.errors, self.ring, self.profile, get_args())
+            )
             self.process.daemon = True
             self.process.start()
 
-    def _run(self, command, result, args):
-        receiver = Receiver(command, result, args)
+    def _run(self, command, result, errors, ring, profile, args):
+        receiver = Receiver(command, result, errors, ring, profile, args)
         receiver.run()
 
     def connect(self):
         self.run()
         self.command.put("connect")
         self.get_result(60)
+        if self.interval is not None:
+            self.stream(self.interval, self.policy)
 
     def disconnect(self):
-        if not self.process.is_alive():
+        if self.process is None or not self.process.is_alive():
             return
 
         self.command.put("disconnect")
@@ -43,11 +54,60 @@ class Wrapper(Interface):
         except TimeoutError:
             self.process.terminate()
 
+    def close(self):
+        self.ring.close()
+
+    def stream(self, interval, policy=TickScheduler.SKIP):
+        """
+        Device process starts to read samples on its own schedule into shared ring buffer,
+        read() then only consumes them
+        """
+        self.interval = interval
+        self.policy = policy
+        self.ring.skip()
+        self.ring.start()
+        self.drain(self.errors)
+        self.command.put(("stream", interval, policy))
+
+    def stats(self):
+        stats = self.ring.get_stats()
+        # samples overwritten in ring before this side read them
+        stats["dropped"] = self.ring.dropped
+        return stats
+
     def read(self):
         self.run()
+        if self.interval is not None:
+            return self.read_stream(self.interval + 60)
+
         self.command.put("read")
         return self.get_result(60)
 
+    def read_stream(self, timeout):
+        deadline = time() + timeout
+        while True:
+            sample = self.ring.get(1)
+            if sample is not None:
+                return sample
+
+            try:
+                self.raise_error(self.errors.get(block=True, timeout=0.1))
+            except Empty:
+                pass
+
+            if self.ring.stopped():
+                return "disconnected"
+
+            if deadline <= time():
+                raise TimeoutError
+
+    def drain(self, source):
+        while True:
+            try:
+                source.get_nowait()
+            except Empty:
+                return
+
     def get_result(self, timeout):
         timeout = time() + timeout
         result = None
@@ -61,44 +121,56 @@ class Wrapper(Interface):
         if result is None:
             raise TimeoutError
 
-        if "FatalErrorException" in result:
-            raise FatalErrorException(result)
-        if "Traceback" in result:
-            raise ErrorException(result)
+        status, value = result
+        if status == "error":
+            self.raise_error(value)
+
+        if value is None:
+            raise TimeoutError
+
+        return value
 
-        return result
+    def raise_error(self, error):
+        if error["fatal"]:
+            raise FatalErrorException(error["traceback"])
+        raise ErrorException(error["traceback"])
 
 
 class Receiver:
-    def __init__(self, command, result, args):
+    def __init__(self, command, result, errors, ring, profile, args):
         self.command = command
         self.result = result
+        self.errors = errors
+        self.ring = ring
+        self.profile = profile
         initialize_paths_from_args(args)
 
     def run(self):
         config = Config()
 
-        version = config.read("version")
+        version = self.read(config, "version")
         serialTimeout = int(config.read("serial_timeout", 10))
         if version.startswith("TC"):
             if version.endswith("USB"):
-                interface = TcSerialInterface(config.read("port"), serialTimeout)
+                interface = TcSerialInterface(self.read(config, "port"), serialTimeout)
             else:
-                interface = TcBleInterface(config.read("ble_address"))
+                interface = TcBleInterface(self.read(config, "ble_address"))
         else:
             if version.endswith("Serial"):
-                interface = UmInterface(config.read("port"), serialTimeout)
+                interface = UmInterface(self.read(config, "port"), serialTimeout)
             else:
-                interface = UmRfcommInterface(config.read("rfcomm_address"))
+                interface = UmRfcommInterface(self.read(config, "rfcomm_address"))
 
             if version.startswith("UM25C"):
                 interface.enable_higher_resolution()
 
+        message = None
         while True:
-            try:
-                message = self.command.get(block=True, timeout=1)
-            except queue.Empty:
-                continue
+            if message is None:
+                try:
+                    message = self.command.get(block=True, timeout=1)
+                except queue.Empty:
+                    continue
 
             if message == "connect":
                 self.result.put(self.call(interface.connect, "connected"))
@@ -107,14 +179,64 @@ class Receiver:
             if message == "read":
                 self.result.put(self.call(interface.read))
 
+            if isinstance(message, tuple) and message[0] == "stream":
+                message = self.stream(interface, message[1], message[2])
+            else:
+                message = None
+
+    def read(self, config, name):
+        """
+        Connection settings come from device profile if there is one, otherwise from global config
+        """
+        if self.profile is not None:
+            return self.profile.get(name)
+        return config.read(name)
+
+    def stream(self, interface, interval, policy):
+        """
+        Reads samples at ticks of scheduler until another command arrives, that command is returned,
+        samples are timestamped with time of their tick
+        """
+        scheduler = TickScheduler(interval, policy)
+        while True:
+            wait = scheduler.remaining()
+            try:
+                message = self.command.get(block=wait > 0, timeout=wait if wait > 0 else None)
+                # wakes up consumer waiting for next sample
+                self.ring.stop()
+                return message
+            except queue.Empty:
+                pass
+
+            timestamp = scheduler.fire()
+            status, data = self.call(interface.read)
+            if status == "error" or data is None:
+                if data is None:
+                    data = self.error(TimeoutError("No response from device"))
+                self.errors.put(data)
+                self.ring.wake()
+                return None
+
+            data["timestamp"] = timestamp
+            self.ring.put(data)
+            self.ring.put_stats(scheduler.stats())
+
     def call(self, callback, default=None):
         try:
             result = callback()
             if result is None:
-                return default
-            return result
-        except Exception:
-            return traceback.format_exc()
+                return "ok", default
+            return "ok", result
+        except Exception as e:
+            return "error", self.error(e)
+
+    def error(self, exception):
+        return {
+            "type": type(exception).__name__,
+            "fatal": isinstance(exception, FatalErrorException),
+            "message": str(exception),
+            "traceback": traceback.format_exc() if exception.__traceback__ else str(exception),
+        }
 
 
 class ErrorException(Exception):
@@ -133,6 +133,7 @@ ntdrt.application = {
         });
 
         self.connection();
+        self.devices();
         self.log();
         self.current();
 
@@ -223,6 +224,33 @@ ntdrt.application = {
             ble();
         }
 
+        var importJob = $('[data-import-job]');
+        if (importJob.length) {
+            socket.on('import-progress', function (message) {
+                var data = JSON.parse(message);
+                if (data['kind'] !== importJob.attr('data-import-kind')) {
+                    return;
+                }
+
+                importJob.find('[data-import-status]').text(data['state']);
+                importJob.find('[data-import-parsed]').text(data['parsed']);
+                importJob.find('[data-import-inserted]').text(data['inserted']);
+                importJob.find('[data-import-rate]').text(data['rate']);
+
+                if (data['state'] !== 'running' && importJob.attr('data-import-state') === 'running') {
+                    importJob.attr('data-import-state', data['state']);
+                    // import page collects finished job and redirects to its graph when there is nothing to show
+                    window.location.reload();
+                }
+            });
+        }
+
+        $(document).on('click', '[data-import-cancel]', function (e) {
+            e.preventDefault();
+            socket.emit('cancel_import');
+            $(this).prop('disabled', true);
+        });
+
         socket.on('scan-result', function (result) {
             $('.scan-result').html("<pre>" + result + "</pre>");
         });
@@ -246,6 +274,60 @@ ntdrt.application = {
         });
     },
 
+    devices: function () {
+        var self = this;
+        var devices = $('.devices [data-device]');
+        if (!devices.length) {
+            return;
+        }
+
+        var socket = self.socket;
+        var find = function (message) {
+            var data = JSON.parse(message);
+            data['row'] = devices.filter('[data-device="' + data['device'] + '"]');
+            return data;
+        };
+
+        var join = function () {
+            devices.each(function () {
+                socket.emit('join', $(this).attr('data-device'));
+            });
+        };
+        socket.on('connect', join);
+
+        socket.on('device-status', function (message) {
+            var data = find(message);
+            var status = data['data'];
+            data['row'].find('[data-device-status]').text(status.charAt(0).toUpperCase() + status.slice(1));
+            data['row'].find('[data-device-connect]').text(status === 'disconnected' ? 'Connect' : 'Disconnect');
+            data['row'].attr('data-device-connected', status === 'disconnected' ? '' : 'yes');
+        });
+
+        socket.on('device-update', function (message) {
+            var data = find(message);
+            var table = data['data']['table'];
+            data['row'].find('[data-device-value="voltage"]').text(table[1]);
+            data['row'].find('[data-device-value="current"]').text(table[2]);
+            data['row'].find('[data-device-value="power"]').text(table[3]);
+        });
+
+        socket.on('device-log-error', function (message) {
+            var data = find(message);
+            data['row'].find('[data-device-status]').text('Error, see Log');
+        });
+
+        $(document).on('click', '[data-device-connect]', function (e) {
+            e.preventDefault();
+            var row = $(this).closest('[data-device]');
+            var device = row.attr('data-device');
+            if (row.attr('data-device-connected')) {
+                socket.emit('close', device);
+            } else {
+                socket.emit('open', JSON.stringify({device: device}));
+            }
+        });
+    },
+
     collect_connection_data: function () {
         var form = $('#connect');
         return {
@@ -458,6 +540,8 @@ ntdrt.application = {
                 url += '&left_axis=' + left_axis;
                 url += '&right_axis=' + right_axis;
                 url += '&colors=' + colorsMode;
+                // a few points per pixel is enough, server downsamples the rest
+                url += '&max_points=' + Math.max(1000, Math.round(graph.width() * 2));
 
                 var pageUrl = new URL(window.location.href);
                 var changed = false;
@@ -713,6 +797,58 @@ ntdrt.application = {
                     }
                     chart.set('cursor', cursor);
 
+                    // load more detailed data for zoomed range
+                    var zoomTimeout = null;
+                    var zoomRange = null;
+                    var onZoom = function () {
+                        if (zoomTimeout) {
+                            clearTimeout(zoomTimeout);
+                        }
+                        zoomTimeout = setTimeout(function () {
+                            if (!data.length || chartRoot !== root) {
+                                return;
+                            }
+                            var start = Math.floor(xAxis.getPrivate('selectionMin'));
+                            var end = Math.ceil(xAxis.getPrivate('selectionMax'));
+                            var first = data[0]['date'];
+                            var last = data[data.length - 1]['date'];
+                            var range = null;
+                            if (start > first || end < last) {
+                                range = start + '-' + end;
+                            }
+                            if (range === zoomRange) {
+                                return;
+                            }
+                            zoomRange = range;
+
+                            if (range === null) {
+                                leftSeries.data.setAll(data);
+                                rightSeries.data.setAll(data);
+                                return;
+                            }
+
+                            $.get(url + '&start=' + start + '&end=' + end, function (detail) {
+                                if (zoomRange !== range || chartRoot !== root) {
+                                    return;
+                                }
+                                var merged = [];
+                                for (var index = 0; index < data.length && data[index]['date'] < start; index++) {
+                                    merged.push(data[index]);
+                                }
+                                merged = merged.concat(detail);
+                                for (index = 0; index < data.length; index++) {
+                                    if (data[index]['date'] > end) {
+                                        merged.push(data[index]);
+                                    }
+                                }
+                                leftSeries.data.setAll(merged);
+                                rightSeries.data.setAll(merged);
+                            });
+                        }, 500);
+                    };
+                    xAxis.onPrivate('selectionMin', onZoom);
+                    xAxis.onPrivate('selectionMax', onZoom);
+
                     var timeout = null;
                     var onFrameEnded = function () {
                         if (timeout) {
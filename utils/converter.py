@@ -1,4 +1,25 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
 class Converter:
     def convert(self, item):
         item["current-m"] = round(item["current"] * 1000)
         return item
+
+    def convert_arrays(self, arrays):
+        if "current" in arrays:
+            arrays["current-m"] = numpy.round(arrays["current"] * 1000)
+        return arrays
+
+    def run_time(self, timestamp, resistance):
+        # run time starts with the first measurement with load connected
+        loaded = numpy.flatnonzero(resistance < 9999.9)
+        if not len(loaded):
+            return numpy.zeros(len(timestamp))
+        offset = loaded[0]
+        run_time = numpy.round(timestamp - timestamp[offset])
+        run_time[:offset] = 0
+        return run_time
@@ -0,0 +1,189 @@
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+modes = ["lttb", "minmax"]
+
+
+def downsample(items, fields, threshold, mode="lttb", x="timestamp"):
+    """
+    Reduce number of items to roughly threshold while keeping visual shape of given fields.
+    Each field is downsampled separately and selected items are merged, so the result can have
+    up to len(fields) * threshold items. Order of items is preserved.
+    Items can be dictionaries or tuples, fields and x are keys or indexes respectively.
+    """
+    if threshold <= 0 or len(items) <= threshold:
+        return items
+
+    callback = min_max if mode == "minmax" else lttb
+
+    selected = set()
+    for field in fields:
+        indexes = []
+        points = []
+        for index, item in enumerate(items):
+            value = item[field]
+            if value is not None:
+                indexes.append(index)
+                points.append((item[x], value))
+
+        for index in callback(points, threshold):
+            selected.add(indexes[index])
+
+    return [items[index] for index in sorted(selected)]
+
+
+def lttb(points, threshold):
+    """
+    Largest-Triangle-Three-Buckets, returns indexes of selected points
+    """
+    length = len(points)
+    if threshold >= length or threshold < 3:
+        return list(range(length))
+
+    selected = [0]
+    bucket_size = (length - 2) / (threshold - 2)
+    previous = 0
+    for bucket in range(threshold - 2):
+        begin = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # average of next bucket is used as third point of the triangle
+        next_begin = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, length)
+        count = next_end - next_begin
+        average_x = 0.0
+        average_y = 0.0
+        for index in range(next_begin, next_end):
+            average_x += points[index][0]
+            average_y += points[index][1]
+        average_x /= count
+        average_y /= count
+
+        previous_x, previous_y = points[previous]
+        maximum_area = -1
+        maximum_index = begin
+        for index in range(begin, end):
+            point_x, point_y = points[index]
+            area = abs(
+                (previous_x - average_x) * (point_y - previous_y) - (previous_x - point_x) * (average_y - previous_y)
+            )
+            if area > maximum_area:
+                maximum_area = area
+                maximum_index = index
+
+        selected.append(maximum_index)
+        previous = maximum_index
+
+    selected.append(length - 1)
+    return selected
+
+
+def min_max(points, threshold):
+    """
+    Keeps minimum and maximum of each bucket, returns indexes of selected points
+    """
+    length = len(points)
+    buckets = threshold // 2
+    if threshold >= length or buckets < 1:
+        return list(range(length))
+
+    selected = [0]
+    bucket_size = length / buckets
+    for bucket in range(buckets):
+        begin = int(bucket * bucket_size)
+        end = min(int((bucket + 1) * bucket_size), length)
+        if begin >= end:
+            continue
+
+        minimum_index = maximum_index = begin
+        for index in range(begin + 1, end):
+            value = points[index][1]
+            if value < points[minimum_index][1]:
+                minimum_index = index
+            elif value > points[maximum_index][1]:
+                maximum_index = index
+
+        selected.extend(sorted({minimum_index, maximum_index}))
+
+    selected.append(length - 1)
+    return selected
+
+
+def downsample_arrays(x, series, threshold, mode="lttb"):
+    """
+    Same as downsample but for NumPy arrays (NaN is treated as missing value), returns sorted indexes
+    """
+    length = len(x)
+    if threshold <= 0 or length <= threshold:
+        return numpy.arange(length)
+
+    callback = min_max_arrays if mode == "minmax" else lttb_arrays
+
+    selected = []
+    for y in series:
+        indexes = numpy.flatnonzero(~numpy.isnan(y))
+        selected.append(indexes[callback(x[indexes], y[indexes], threshold)])
+
+    return numpy.unique(numpy.concatenate(selected))
+
+
+def lttb_arrays(x, y, threshold):
+    length = len(x)
+    if threshold >= length or threshold < 3:
+        return numpy.arange(length)
+
+    # relative to first point, cumulative sum of large timestamps would lose precision
+    x = x - x[0]
+    bucket_size = (length - 2) / (threshold - 2)
+    bounds = numpy.minimum((numpy.arange(threshold) * bucket_size).astype(numpy.int64) + 1, length)
+    sum_x = numpy.concatenate(([0.0], numpy.cumsum(x)))
+    sum_y = numpy.concatenate(([0.0], numpy.cumsum(y)))
+
+    selected = numpy.empty(threshold, dtype=numpy.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        begin = bounds[bucket]
+        end = bounds[bucket + 1]
+        next_end = bounds[bucket + 2]
+
+        count = next_end - end
+        average_x = (sum_x[next_end] - sum_x[end]) / count
+        average_y = (sum_y[next_end] - sum_y[end]) / count
+
+        previous_x = x[previous]
+        previous_y = y[previous]
+        area = numpy.abs(
+            (previous_x - average_x) * (y[begin:end] - previous_y)
+            - (previous_x - x[begin:end]) * (average_y - previous_y)
+        )
+        previous = begin + int(numpy.argmax(area))
+        selected[bucket + 1] = previous
+
+    return selected
+
+
+def min_max_arrays(x, y, threshold):
+    length = len(x)
+    buckets = threshold // 2
+    if threshold >= length or buckets < 1:
+        return numpy.arange(length)
+
+    bounds = (numpy.arange(buckets + 1) * (length / buckets)).astype(numpy.int64)
+    bounds[-1] = length
+
+    selected = [0]
+    for bucket in range(buckets):
+        begin = bounds[bucket]
+        end = bounds[bucket + 1]
+        if begin >= end:
+            continue
+        values = y[begin:end]
+        selected.append(begin + int(numpy.argmin(values)))
+        selected.append(begin + int(numpy.argmax(values)))
+    selected.append(length - 1)
+
+    return numpy.unique(selected)
@@ -0,0 +1,247 @@
+import csv
+from itertools import chain, islice, repeat
+from time import time
+
+import pendulum
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utils.formatting import Format
+
+
+class TimeParser:
+    """
+    Parses time of imported measurements, fixed "YYYY-MM-DD HH:mm:ss" format is parsed by slicing
+    with timestamp of the day cached, other formats (or malformed values) go through pendulum.
+    """
+
+    def __init__(self, time_format):
+        self.time_format = time_format
+        self.fast = time_format == "YYYY-MM-DD HH:mm:ss"
+        self.days = {}
+
+    def parse(self, value):
+        if self.fast and len(value) == 19 and value[10] == " " and value[13] == ":" and value[16] == ":":
+            day = self.days.get(value[:10])
+            if day is None:
+                day = pendulum.from_format(value[:10], "YYYY-MM-DD").timestamp()
+                self.days[value[:10]] = day
+
+            if value[11:13].isdigit() and value[14:16].isdigit() and value[17:19].isdigit():
+                hours = int(value[11:13])
+                minutes = int(value[14:16])
+                seconds = int(value[17:19])
+                if hours < 24 and minutes < 60 and seconds < 60:
+                    return day + hours * 3600 + minutes * 60 + seconds
+
+        return pendulum.from_format(value, self.time_format).timestamp()
+
+
+class CsvImporter:
+    BATCH_SIZE = 10000
+
+    defaults = {
+        "voltage": 0,
+        "current": 0,
+        "power": 0,
+        "temperature": 0,
+        "data_plus": 0,
+        "data_minus": 0,
+        "mode_id": 0,
+        "mode_name": None,
+        "accumulated_current": 0,
+        "accumulated_power": 0,
+        "accumulated_time": 0,
+        "resistance": 0,
+    }
+
+    def __init__(self, storage, version, job=None):
+        self.storage = storage
+        self.version = version
+        self.job = job
+        self.format = Format(version)
+        self.time_parser = TimeParser(self.format.time_format)
+        self.columns = ["timestamp"] + list(self.defaults.keys()) + ["session_id"]
+        self.mapping = {}
+        self.messages = []
+        self.session_id = None
+        self.parsed = 0
+        self.inserted = 0
+
+    def run(self, file, session_name):
+        reader = csv.reader(file, delimiter=",")
+
+        header = next(reader, None)
+        if header is not None:
+            for index, name in enumerate(header):
+                field = self.format.field_name_reverse(name)
+                if field is not None:
+                    self.mapping[field] = index
+
+        if "time" not in self.mapping:
+            self.messages.append(
+                "Invalid CSV layout: time column not found, make sure your column names are correct"
+            )
+            return self.messages
+
+        batch = []
+        row_number = 1
+        for row in reader:
+            row_number += 1
+            batch.append((row_number, row))
+            if len(batch) >= self.BATCH_SIZE:
+                self.store(batch, session_name)
+                batch = []
+                if self.cancelled():
+                    return self.messages
+
+        if len(batch):
+            self.store(batch, session_name)
+
+        return self.messages
+
+    def cancelled(self):
+        if self.job is not None and self.job.cancelled:
+            self.messages.append("Import cancelled, %s rows were imported" % self.inserted)
+            return True
+        return False
+
+    def store(self, batch, session_name):
+        if self.session_id is None:
+            self.session_id = self.storage.create_session(session_name, self.version)
+
+        time_index = self.mapping["time"]
+        timestamps = []
+        valid = []
+        for row_number, row in batch:
+            value = row[time_index] if time_index < len(row) else ""
+            try:
+                timestamps.append(self.time_parser.parse(value))
+            except ValueError:
+                self.messages.append("Warning: unable to parse time: %s, skipping row: %s" % (value, row_number))
+                continue
+            valid.append((row_number, row))
+
+        try:
+            values = self.convert([row for row_number, row in valid])
+        except (ValueError, IndexError):
+            # find rows with invalid values one by one
+            values = None
+
+        if values is None:
+            rows = []
+            for timestamp, (row_number, row) in zip(timestamps, valid):
+                try:
+                    converted = self.convert([row])
+                except (ValueError, IndexError):
+                    self.messages.append("Warning: unable to parse values, skipping row: %s" % row_number)
+                    continue
+                rows.append((timestamp,) + next(zip(*converted)))
+        else:
+            rows = list(zip(timestamps, *values))
+
+        self.storage.store_rows(self.columns, rows)
+
+        self.parsed += len(batch)
+        self.inserted += len(rows)
+        if self.job is not None:
+            self.job.progress(self.parsed, self.inserted, self.session_id)
+
+    def convert(self, rows):
+        columns = []
+        for field, default in self.defaults.items():
+            if field in self.mapping:
+                index = self.mapping[field]
+                columns.append(self.to_floats([row[index] for row in rows]))
+            else:
+                columns.append(repeat(default, len(rows)))
+        columns.append(repeat(self.session_id, len(rows)))
+        return columns
+
+    def to_floats(self, values):
+        if numpy is not None:
+            return numpy.array(values, dtype=numpy.float64).tolist()
+        return [float(value) for value in values]
+
+
+class Tc66cImporter:
+    """
+    Imports offline recording of TC66C as pipeline of generators: records are decoded by interface,
+    enriched with calculated values and committed in chunks.
+    """
+    BATCH_SIZE = 10000
+
+    columns = [
+        "timestamp", "voltage", "current", "power", "temperature", "data_plus", "data_minus", "mode_id",
+        "mode_name", "accumulated_current", "accumulated_power", "accumulated_time", "resistance", "session_id",
+    ]
+
+    def __init__(self, storage, job=None):
+        self.storage = storage
+        self.job = job
+        self.messages = []
+        self.inserted = 0
+
+    def run(self, interface, name, period=1, calculate=False):
+        records = iter(interface.read_records())
+        first = next(records, None)
+        if first is None:
+            return self.messages
+
+        session_id = self.storage.create_session(name, "TC66C recording")
+        rows = self.enrich(chain([first], records), session_id, time(), period, calculate)
+        for chunk in self.chunks(rows):
+            self.storage.store_rows(self.columns, chunk)
+            self.inserted += len(chunk)
+
+            if self.job is not None:
+                self.job.progress(self.inserted, self.inserted, session_id)
+                if self.job.cancelled:
+                    self.messages.append("Import cancelled, %s records were imported" % self.inserted)
+                    break
+
+        return self.messages
+
+    def enrich(self, records, session_id, begin, period, calculate):
+        previous_timestamp = None
+        accumulated_current = 0
+        accumulated_power = 0
+        for index, record in enumerate(records):
+            timestamp = begin + (index * period)
+            voltage = round(record["voltage"] * 10000) / 10000
+            current = round(record["current"] * 100000) / 100000
+            power = 0
+            resistance = 0
+            stored_current = round(accumulated_current)
+            stored_power = round(accumulated_power)
+
+            if calculate:
+                power = round(record["voltage"] * record["current"] * 1000) / 1000
+                if record["current"] <= 0 and record["current"] >= 0:
+                    resistance = 9999.9
+                else:
+                    resistance = round(record["voltage"] / record["current"] * 10) / 10
+                    if resistance > 9999.9:
+                        resistance = 9999.9
+
+                if previous_timestamp is not None:
+                    delta = (timestamp - previous_timestamp) / 3600
+                    accumulated_current += (current * 1000) * delta
+                    accumulated_power += (power * 1000) * delta
+
+            yield (
+                timestamp, voltage, current, power, 0, 0, 0, 0,
+                None, stored_current, stored_power, 0, resistance, session_id,
+            )
+
+            previous_timestamp = timestamp
+
+    def chunks(self, rows):
+        while True:
+            chunk = list(islice(rows, self.BATCH_SIZE))
+            if not chunk:
+                return
+            yield chunk
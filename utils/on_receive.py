@@ -0,0 +1,202 @@
+import array
+from collections import deque
+import json
+import logging
+import os
+from queue import Full
+import subprocess
+from threading import Event
+from time import time
+
+try:
+    import fcntl
+    import termios
+except ImportError:
+    fcntl = None
+
+from utils.worker import QueueWorker
+
+
+class OnReceiveWorker(QueueWorker):
+    """
+    Keeps one --on-receive process running and writes batches of measurements to its stdin
+    as newline-delimited JSON, process is restarted (with backoff) whenever it exits.
+    When process doesn't keep up, pipe and then the queue fill up and put() refuses new batches.
+    """
+    QUEUE_SIZE = 100
+    RESTART_DELAY = 1
+    MAX_RESTART_DELAY = 60
+    # process has to run at least this long (in seconds) before backoff is reset
+    MIN_UPTIME = 10
+
+    name = "on-receive"
+    reported_fields = ["lost", "restarts"]
+
+    def __init__(self, command, queue_size=QUEUE_SIZE):
+        super().__init__(queue_size, 1)
+        self.command = command
+        self.process = None
+        self.started = None
+        # sizes of batches written to current process, newest last, enough to cover full pipe
+        self.written = deque(maxlen=4096)
+        self.stopped = Event()
+        self.restart_delay = self.RESTART_DELAY
+        self.exited = False
+        self.restarts = 0
+        self.lost = 0
+
+    def start(self):
+        self.stopped.clear()
+        super().start()
+
+    def put(self, batch):
+        # caller keeps batch that didn't fit and sends it later, so it isn't counted as dropped
+        try:
+            self.queue.put_nowait(batch)
+            return True
+        except Full:
+            return False
+
+    def close(self, timeout=10):
+        self.running = False
+        self.stopped.set()
+        if self.thread:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logging.warning("on-receive process didn't accept remaining batches in time, terminating it")
+                self.terminate()
+                self.thread.join(timeout)
+            self.thread = None
+        self.report(force=True)
+
+    def run(self):
+        pending = None
+        while True:
+            self.reap()
+            self.report()
+            if pending is None:
+                batch = self.collect([], 1)
+                if not batch:
+                    if not self.running:
+                        break
+                    continue
+                pending = (json.dumps(batch[0]) + "\n").encode("utf-8")
+
+            if not self.spawn():
+                if not self.running:
+                    break
+                continue
+
+            try:
+                self.process.stdin.write(pending)
+                self.process.stdin.flush()
+                self.written.append(len(pending))
+                pending = None
+            except (BrokenPipeError, OSError, ValueError):
+                logging.warning("on-receive process '%s' stopped accepting data" % self.command)
+                self.terminate()
+
+        self.finish()
+
+    def reap(self):
+        """
+        Notices that process exited, restart itself is delayed until next batch
+        """
+        if self.process is None or self.process.poll() is None:
+            return
+
+        self.count_lost()
+        if time() - self.started >= self.MIN_UPTIME:
+            self.restart_delay = self.RESTART_DELAY
+        logging.warning("on-receive process '%s' exited with code %s" % (self.command, self.process.returncode))
+        self.process = None
+        self.exited = True
+
+    def spawn(self):
+        self.reap()
+        if self.process is not None:
+            return True
+
+        if self.exited:
+            logging.info("restarting on-receive process in %s seconds" % self.restart_delay)
+            if self.stopped.wait(self.restart_delay):
+                return False
+            self.restart_delay = min(self.restart_delay * 2, self.MAX_RESTART_DELAY)
+            self.restarts += 1
+            self.exited = False
+
+        logging.info("starting --on-receive command '%s' in stream mode" % self.command)
+        env = os.environ.copy()
+        env["PYTHONPATH"] = ""
+        try:
+            self.process = subprocess.Popen(self.command, shell=True, env=env, stdin=subprocess.PIPE)
+        except OSError as e:
+            logging.exception(e)
+            self.process = None
+            self.stopped.wait(self.restart_delay)
+            return False
+        self.started = time()
+        self.written.clear()
+        return True
+
+    def count_lost(self):
+        """
+        Batches left unread in pipe of exited process are lost, they are counted from pipe size
+        where it is available (data already buffered by the process itself can't be seen)
+        """
+        unread = self.unread()
+        if unread is None:
+            if self.written:
+                logging.warning("on-receive process exited, batches it didn't read may be lost")
+            return
+
+        lost = 0
+        while unread > 0 and self.written:
+            unread -= self.written.pop()
+            lost += 1
+        if lost:
+            logging.warning("on-receive process exited without reading %s batches" % lost)
+        self.lost += lost
+
+    def unread(self):
+        if fcntl is None:
+            return None
+        try:
+            size = array.array("i", [0])
+            fcntl.ioctl(self.process.stdin.fileno(), termios.FIONREAD, size, True)
+            return size[0]
+        except (OSError, ValueError):
+            return None
+
+    def finish(self):
+        self.reap()
+        if self.process is None:
+            return
+
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.terminate()
+
+    def terminate(self):
+        process = self.process
+        if process is not None and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def stats(self):
+        stats = super().stats()
+        stats["lost"] = self.lost
+        stats["restarts"] = self.restarts
+        return stats
+
+    def format_report(self, stats):
+        return "on-receive: %s batches lost, %s restarts of process" % (stats["lost"], stats["restarts"])
@@ -0,0 +1,90 @@
+from math import sqrt
+from time import monotonic, time
+
+
+class TickScheduler:
+    """
+    Tick n is due at start + n * interval on monotonic clock, so slow reads, retries or pauses
+    don't accumulate into drift. When several ticks are due, only the latest one is fired (skip)
+    or all of them in a burst limited to MAX_BURST ticks (catch-up).
+    """
+    SKIP = "skip"
+    CATCH_UP = "catch-up"
+    policies = [SKIP, CATCH_UP]
+
+    MAX_BURST = 10
+
+    def __init__(self, interval, policy=SKIP):
+        self.interval = interval
+        self.policy = policy if policy in self.policies else self.SKIP
+        self.start = monotonic()
+        self.wall_start = time()
+        self.tick = 0
+        self.ticks = 0
+        self.missed = 0
+        self.late = 0
+        self.jitter_sum = 0.0
+        self.jitter_square_sum = 0.0
+        self.jitter_max = 0.0
+
+    def deadline(self):
+        return self.start + self.tick * self.interval
+
+    def remaining(self):
+        return self.deadline() - monotonic()
+
+    def fire(self):
+        """
+        Records start of current tick and advances to the next one, returns wall clock time of the tick
+        """
+        now = monotonic()
+        if now > self.deadline():
+            # ticks due after the current one, skip keeps only the latest
+            behind = int((now - self.deadline()) / self.interval)
+            allowed = self.MAX_BURST - 1 if self.policy == self.CATCH_UP else 0
+            if behind > allowed:
+                self.tick += behind - allowed
+                self.missed += behind - allowed
+
+        lateness = max(now - self.deadline(), 0.0)
+        self.ticks += 1
+        self.jitter_sum += lateness
+        self.jitter_square_sum += lateness * lateness
+        self.jitter_max = max(self.jitter_max, lateness)
+        if lateness > self.interval / 2:
+            self.late += 1
+
+        timestamp = self.wall_start + self.tick * self.interval
+        self.tick += 1
+        return timestamp
+
+    def stats(self):
+        if self.ticks:
+            mean = self.jitter_sum / self.ticks
+            deviation = sqrt(max(self.jitter_square_sum / self.ticks - mean * mean, 0.0))
+        else:
+            mean = deviation = 0.0
+
+        return {
+            "ticks": self.ticks,
+            "missed": self.missed,
+            "late": self.late,
+            "jitter_mean": mean,
+            "jitter_max": self.jitter_max,
+            "jitter_deviation": deviation,
+        }
+
+    @staticmethod
+    def format_stats(stats):
+        return (
+            "sampling: %(ticks)s ticks, %(missed)s missed, %(late)s late, %(dropped)s dropped, "
+            "jitter avg %(mean).1f ms, max %(max).1f ms, stddev %(deviation).1f ms"
+        ) % {
+            "ticks": stats["ticks"],
+            "missed": stats["missed"],
+            "late": stats["late"],
+            "dropped": stats.get("dropped", 0),
+            "mean": stats["jitter_mean"] * 1000,
+            "max": stats["jitter_max"] * 1000,
+            "deviation": stats["jitter_deviation"] * 1000,
+        }
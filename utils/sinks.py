@@ -0,0 +1,179 @@
+import csv
+import importlib
+import json
+import logging
+import os
+import socket
+
+from utils.worker import QueueWorker
+
+
+class Sink:
+    """
+    Receives measurements in-process, subclass it and select it with --sink "module:Class,option=value".
+    Options are passed to constructor as strings, write() is called from dedicated thread with lists of
+    measurement dicts (same structure as --on-receive payload), so it can block without stalling acquisition.
+    """
+
+    def __init__(self, **options):
+        self.options = options
+
+    def open(self, device):
+        """
+        Called once on connect, device is id of device profile or None for default device
+        """
+        pass
+
+    def write(self, batch):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    """
+    Appends measurements to CSV file, header is written when file is new,
+    {device} in path is replaced with device id (or "default")
+    """
+    columns = [
+        "session_id", "timestamp", "voltage", "current", "power", "temperature", "data_plus", "data_minus",
+        "mode_id", "mode_name", "accumulated_current", "accumulated_power", "accumulated_time", "resistance",
+    ]
+
+    file = None
+    writer = None
+
+    def __init__(self, path="measurements-{device}.csv", delimiter=",", **options):
+        super().__init__(**options)
+        self.path = path
+        self.delimiter = delimiter
+
+    def open(self, device):
+        path = self.path.replace("{device}", device or "default")
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, self.columns, delimiter=self.delimiter, extrasaction="ignore")
+        if new:
+            self.writer.writeheader()
+
+    def write(self, batch):
+        self.writer.writerows(batch)
+        self.file.flush()
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+class UdpSink(Sink):
+    """
+    Sends every measurement as one JSON datagram to local UDP port, fire-and-forget
+    """
+
+    socket = None
+    device = None
+
+    def __init__(self, host="127.0.0.1", port="9999", **options):
+        super().__init__(**options)
+        self.address = (host, int(port))
+
+    def open(self, device):
+        self.device = device
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def write(self, batch):
+        for data in batch:
+            if self.device is not None:
+                data = dict(data, device=self.device)
+            try:
+                self.socket.sendto(json.dumps(data).encode("utf-8"), self.address)
+            except OSError as e:
+                # nobody listening (ICMP port unreachable) is not a reason to stop
+                logging.debug("udp sink: %s" % e)
+
+    def close(self):
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+
+class SinkWorker(QueueWorker):
+    """
+    Feeds one sink from background thread, sink gets whatever measurements accumulated while it was busy
+    """
+
+    def __init__(self, sink, queue_size=10000, batch_size=500):
+        super().__init__(queue_size, batch_size)
+        self.sink = sink
+        self.name = "sink %s" % type(sink).__name__
+
+    def start(self, device=None):
+        self.sink.open(device)
+        super().start()
+
+    def close(self, timeout=10):
+        super().close(timeout)
+        try:
+            self.sink.close()
+        except Exception as e:
+            logging.exception(e)
+
+    def run(self):
+        while self.running or not self.queue.empty():
+            batch = self.collect([], 1)
+            if batch:
+                try:
+                    self.sink.write(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    logging.exception(e)
+
+            self.report()
+
+    def format_report(self, stats):
+        return "%s: %s dropped, %s failed measurements" % (self.name, stats["dropped"], stats["failed"])
+
+
+def parse_sink(spec):
+    """
+    Resolves "package.module:Class,option=value,..." specification to sink class and its options,
+    so invalid specification is reported on startup instead of on connect
+    """
+    path, *options = spec.split(",")
+    module_name, _, class_name = path.partition(":")
+    if not class_name:
+        raise ValueError("sink '%s' has to be specified as module:Class" % spec)
+
+    parsed = {}
+    for option in options:
+        name, separator, value = option.partition("=")
+        if not separator:
+            raise ValueError("sink option '%s' has to be specified as name=value" % option)
+        parsed[name.strip()] = value
+
+    try:
+        module = importlib.import_module(module_name.strip())
+    except ImportError as e:
+        raise ValueError("sink '%s' can't be loaded: %s" % (spec, e))
+
+    sink_class = getattr(module, class_name.strip(), None)
+    if not isinstance(sink_class, type) or not issubclass(sink_class, Sink):
+        raise ValueError("sink '%s' is not a subclass of utils.sinks.Sink" % spec)
+
+    try:
+        # options are checked by constructing throwaway instance, sink doesn't acquire anything before open()
+        sink_class(**parsed)
+    except (TypeError, ValueError) as e:
+        raise ValueError("sink '%s' has invalid options: %s" % (spec, e))
+
+    return sink_class, parsed
+
+
+def load_sink(spec):
+    """
+    Creates sink from "package.module:Class,option=value,..." specification
+    """
+    sink_class, options = parse_sink(spec)
+    return sink_class(**options)
@@ -1,19 +1,127 @@
-from contextlib import closing
+from contextlib import closing, contextmanager
 import logging
 import os
-import shutil
+from queue import Empty, Full, Queue
 import sqlite3
+from threading import Lock
 from time import time
 
 import pendulum
 
-from utils.config import get_data_path
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from utils.config import Config, get_data_path
 from utils.converter import Converter
+from utils.worker import QueueWorker
+
+
+class ConnectionPool:
+    """
+    Keeps sqlite connections open between calls instead of connecting for every query.
+    Connection is checked out by one thread at a time and returned to the pool afterwards,
+    this way short-living request threads of the web server can reuse them as well.
+    """
+
+    def __init__(self, parameters, configure, pragmas=None, size=4):
+        self.parameters = parameters
+        self.configure = configure
+        self.pragmas = pragmas or []
+        self.size = size
+        self.idle = []
+        self.lock = Lock()
+        self.closed = False
+        self.pid = os.getpid()
+
+    def acquire(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # inherited from parent process by fork, these handles can't be used here
+                self.idle = []
+                self.pid = os.getpid()
+
+            if self.idle:
+                return self.idle.pop()
+
+        connection = sqlite3.connect(check_same_thread=False, **self.parameters)
+        self.configure(connection)
+        self.apply_pragmas(connection)
+        return connection
+
+    def apply_pragmas(self, connection):
+        for name, value in self.pragmas:
+            try:
+                connection.execute("PRAGMA %s = %s" % (name, value))
+            except sqlite3.OperationalError as e:
+                logging.warning("failed to set PRAGMA %s = %s: %s" % (name, value, e))
+
+    def release(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+
+        with self.lock:
+            if not self.closed and len(self.idle) < self.size and self.pid == os.getpid():
+                self.idle.append(connection)
+                return
+
+        connection.close()
+
+    @contextmanager
+    def connection(self):
+        connection = self.acquire()
+        try:
+            yield connection
+        except sqlite3.Error:
+            # connection may be in unknown state, don't reuse it
+            connection.close()
+            raise
+        except BaseException:
+            self.release(connection)
+            raise
+        else:
+            self.release(connection)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            idle = self.idle
+            self.idle = []
+
+        for connection in idle:
+            connection.close()
 
 
 class Storage:
+    DEFAULT_JOURNAL_MODE = "wal"
+    DEFAULT_SYNCHRONOUS = "normal"
+    DEFAULT_CACHE_SIZE = 16
+    DEFAULT_MMAP_SIZE = 64
+    DEFAULT_TEMP_STORE = "memory"
+    DEFAULT_CHECKPOINT_INTERVAL = 60
+    JOURNAL_SIZE_LIMIT = 64 * 1024 * 1024
+
+    journal_modes = ["wal", "delete", "truncate"]
+    synchronous_modes = ["off", "normal", "full"]
+    temp_stores = ["default", "file", "memory"]
+
+    measurement_columns = [
+        "id", "name", "timestamp", "voltage", "current", "power", "temperature", "data_plus", "data_minus",
+        "mode_id", "mode_name", "accumulated_current", "accumulated_power", "accumulated_time", "resistance",
+        "session_id",
+    ]
+    accumulated_fields = ["accumulated_current", "accumulated_power", "accumulated_time"]
+    rollup_resolutions = [1, 10, 60, 600]
+    rollup_fields = ["voltage", "current", "power", "temperature"]
+
+    arrays_supported = numpy is not None
+
     sqlite = None
-    schema_version = 2
+    schema_version = 5
+    pools = {}
+    pools_lock = Lock()
+    baselines = {}
 
     def __init__(self):
         self.parameters = {
@@ -22,13 +130,69 @@ class Storage:
         }
         self.converter = Converter()
 
-    def connect(self, extra_parameters=None):
-        parameters = self.parameters
-        if extra_parameters:
-            parameters.update(extra_parameters)
-        connection = sqlite3.connect(**parameters)
+    @property
+    def pool(self):
+        # resolved on every use, long-living instances pick up pool recreated by close_all (e.g. after Setup)
+        return self.get_pool()
+
+    def get_pool(self):
+        database = self.parameters["database"]
+        with self.pools_lock:
+            if database not in self.pools or self.pools[database].closed:
+                self.pools[database] = ConnectionPool(self.parameters, self.configure, self.read_pragmas())
+            return self.pools[database]
+
+    def read_pragmas(self):
+        setup = Config().read("setup")
+        if not isinstance(setup, dict):
+            setup = {}
+
+        def option(name, data_type, default, choices=None):
+            try:
+                value = data_type(setup[name])
+            except (KeyError, ValueError, TypeError):
+                return default
+            if choices is not None and value not in choices:
+                return default
+            return value
+
+        cache_size = max(0, option("database_cache_size", int, self.DEFAULT_CACHE_SIZE))
+        mmap_size = max(0, option("database_mmap_size", int, self.DEFAULT_MMAP_SIZE))
+
+        return [
+            ("journal_mode", option("database_journal_mode", str, self.DEFAULT_JOURNAL_MODE, self.journal_modes)),
+            ("synchronous", option("database_synchronous", str, self.DEFAULT_SYNCHRONOUS, self.synchronous_modes)),
+            # negative value means size in KiB instead of pages
+            ("cache_size", -cache_size * 1024),
+            ("mmap_size", mmap_size * 1024 * 1024),
+            ("temp_store", option("database_temp_store", str, self.DEFAULT_TEMP_STORE, self.temp_stores)),
+            ("journal_size_limit", self.JOURNAL_SIZE_LIMIT),
+        ]
+
+    @classmethod
+    def close_all(cls):
+        with cls.pools_lock:
+            pools = list(cls.pools.values())
+            cls.pools.clear()
+
+        for pool in pools:
+            pool.close()
+
+    def configure(self, connection):
         connection.row_factory = self.row_factory
-        return connection
+
+    @contextmanager
+    def transaction(self):
+        with self.pool.connection() as sqlite:
+            # write lock is taken upfront, read transaction upgraded to write fails with SQLITE_BUSY
+            # instead of waiting when another connection committed in the meantime
+            sqlite.execute("BEGIN IMMEDIATE")
+            try:
+                yield sqlite
+            except BaseException:
+                sqlite.rollback()
+                raise
+            sqlite.commit()
 
     def row_factory(self, cursor, row):
         dictionary = {}
@@ -37,7 +201,7 @@ class Storage:
         return dictionary
 
     def init(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
             tables = []
@@ -84,6 +248,18 @@ class Storage:
                     "session_id INTEGER"
                     ")"
                 ))
+                self.create_indexes(cursor)
+
+            if "measurements_rollup" not in tables:
+                columns = ["session_id INTEGER", "resolution INTEGER", "bucket INTEGER", "samples INTEGER"]
+                for field in self.rollup_fields:
+                    columns.extend(["%s_min REAL" % field, "%s_max REAL" % field, "%s_sum REAL" % field])
+                cursor.execute((
+                    "CREATE TABLE measurements_rollup (" +
+                    ", ".join(columns) + ", "
+                    "PRIMARY KEY (session_id, resolution, bucket)"
+                    ")"
+                ))
 
             if "sessions" not in tables:
                 cursor.execute((
@@ -91,14 +267,17 @@ class Storage:
                     "id INTEGER PRIMARY KEY,"
                     "version TEXT,"
                     "name TEXT,"
-                    "timestamp INTEGER"
+                    "timestamp INTEGER,"
+                    "measurements INTEGER DEFAULT 0"
                     ")"
                 ))
 
+            backed_up = False
             if schema_version == 1:
                 logging.info("migrating database to new version, this may take a while...")
 
                 self.backup()
+                backed_up = True
 
                 cursor.execute((
                     "ALTER TABLE measurements ADD session_id INTEGER"
@@ -120,97 +299,549 @@ class Storage:
                     ))
 
                 cursor.execute("UPDATE version SET version = 2")
+                schema_version = 2
 
-    def store_measurement(self, data):
-        with closing(self.connect()) as sqlite:
-            self._insert_measurement(sqlite, data)
+            if schema_version == 2:
+                logging.info("migrating database to version 3 (adding indexes), this may take a while...")
 
-    def store_measurements(self, items):
-        with closing(self.connect({"isolation_level": "DEFERRED"})) as sqlite:
-            for data in items:
-                self._insert_measurement(sqlite, data)
-            sqlite.commit()
+                if not backed_up:
+                    self.backup()
 
-    def _insert_measurement(self, sqlite, data):
-        if data is None:
-            return
+                self.create_indexes(cursor, progress=True)
+
+                cursor.execute("UPDATE version SET version = 3")
+                logging.info("database migration finished")
+                schema_version = 3
+
+            if schema_version == 3:
+                logging.info("migrating database to version 4 (building rollups), this may take a while...")
 
-        columns = []
-        placeholders = []
-        values = []
-        for name, value in data.items():
-            columns.append(name)
-            placeholders.append(":" + name)
-            values.append(value)
+                if not backed_up:
+                    self.backup()
 
-        columns = ", ".join(columns)
-        placeholders = ", ".join(placeholders)
-        values = tuple(values)
+                self.build_rollups(cursor)
 
-        cursor = sqlite.cursor()
-        cursor.execute("INSERT INTO measurements (" + columns + ") VALUES (" + placeholders + ")", values)
+                cursor.execute("UPDATE version SET version = 4")
+                logging.info("database migration finished")
+                schema_version = 4
+
+            if schema_version == 4:
+                logging.info("migrating database to version 5 (counting measurements), this may take a while...")
+
+                if not backed_up:
+                    self.backup()
+
+                columns = [row["name"] for row in cursor.execute("PRAGMA table_info(sessions)").fetchall()]
+                if "measurements" not in columns:
+                    cursor.execute("ALTER TABLE sessions ADD measurements INTEGER DEFAULT 0")
+
+                self.report_progress(cursor.connection, "counting measurements")
+                try:
+                    cursor.execute((
+                        "UPDATE sessions SET measurements = "
+                        "(SELECT COUNT(id) FROM measurements WHERE session_id = sessions.id)"
+                    ))
+                finally:
+                    cursor.connection.set_progress_handler(None, 0)
+
+                cursor.execute("UPDATE version SET version = 5")
+                logging.info("database migration finished")
+
+    def build_rollups(self, cursor):
+        aggregates = []
+        for field in self.rollup_fields:
+            aggregates.extend(["MIN(%s)" % field, "MAX(%s)" % field, "TOTAL(%s)" % field])
+
+        for number, resolution in enumerate(self.rollup_resolutions, start=1):
+            logging.info("building rollup %s of %s: %s seconds" % (number, len(self.rollup_resolutions), resolution))
+            self.report_progress(cursor.connection, "building rollup of %s seconds" % resolution)
+            try:
+                cursor.execute((
+                    "INSERT OR REPLACE INTO measurements_rollup "
+                    "SELECT session_id, :resolution, CAST(timestamp / :resolution AS INTEGER) * :resolution, "
+                    "COUNT(id), " + ", ".join(aggregates) + " "
+                    "FROM measurements "
+                    "WHERE session_id IS NOT NULL AND timestamp IS NOT NULL "
+                    "GROUP BY session_id, CAST(timestamp / :resolution AS INTEGER)"
+                ), {"resolution": resolution})
+            finally:
+                cursor.connection.set_progress_handler(None, 0)
+
+    def create_indexes(self, cursor, progress=False):
+        indexes = [
+            ("measurements_session_id_timestamp", "measurements (session_id, timestamp)"),
+            ("measurements_name_timestamp", "measurements (name, timestamp)"),
+        ]
+
+        for number, (name, definition) in enumerate(indexes, start=1):
+            if progress:
+                logging.info("creating index %s of %s: %s" % (number, len(indexes), name))
+                self.report_progress(cursor.connection, "creating index %s" % name)
+            try:
+                cursor.execute("CREATE INDEX IF NOT EXISTS %s ON %s" % (name, definition))
+            finally:
+                cursor.connection.set_progress_handler(None, 0)
+
+    def report_progress(self, connection, operation, interval=5):
+        begin = time()
+        state = {"reported": begin}
+
+        def handler():
+            now = time()
+            if now - state["reported"] >= interval:
+                state["reported"] = now
+                logging.info("%s, still running (%s seconds elapsed)" % (operation, round(now - begin)))
+            return 0
+
+        connection.set_progress_handler(handler, 100000)
+
+    def store_measurement(self, data):
+        self.store_measurements([data])
+
+    def store_measurements(self, items, logs=None):
+        columns = self.measurement_columns[1:]
+        rows = []
+        for data in items:
+            if data is not None:
+                rows.append(tuple(data.get(name) for name in columns))
+        self.store_rows(columns, rows, logs)
+
+    def store_rows(self, columns, rows, logs=None):
+        """
+        Inserts measurements given as tuples of values for given columns in one transaction,
+        this is the fast path for bulk imports since no dictionary is needed per measurement.
+        Log messages are stored in the same transaction.
+        """
+        if not rows and not logs:
+            return
+
+        with self.transaction() as sqlite:
+            if logs:
+                sqlite.executemany("INSERT INTO logs (message) VALUES (?)", [(message,) for message in logs])
+            if not rows:
+                return
+
+            # rows of this transaction get ids above current maximum, rollups are computed from that range
+            first_id = sqlite.execute("SELECT COALESCE(MAX(id), 0) AS id FROM measurements").fetchone()["id"]
+            sqlite.executemany((
+                "INSERT INTO measurements (" + ", ".join(columns) + ") "
+                "VALUES (" + ", ".join(["?"] * len(columns)) + ")"
+            ), rows)
+
+            counts = {}
+            session_index = columns.index("session_id")
+            for row in rows:
+                session = row[session_index]
+                if session is not None:
+                    counts[session] = counts.get(session, 0) + 1
+            sqlite.executemany(
+                "UPDATE sessions SET measurements = measurements + ? WHERE id = ?",
+                [(count, session) for session, count in counts.items()]
+            )
+
+            self._update_rollups(sqlite, first_id)
+
+    def _update_rollups(self, sqlite, first_id):
+        """
+        Aggregates measurements inserted after first_id into rollups in SQL, merging with existing buckets.
+        Only finest resolution is aggregated from measurements, every coarser one from previous resolution.
+        """
+        columns = ["session_id", "resolution", "bucket", "samples"]
+        aggregates = []
+        merges = []
+        updates = ["samples = samples + excluded.samples"]
+        for field in self.rollup_fields:
+            columns.extend(["%s_min" % field, "%s_max" % field, "%s_sum" % field])
+            aggregates.extend(["MIN(%s)" % field, "MAX(%s)" % field, "TOTAL(%s)" % field])
+            merges.extend(["MIN({0}_min)".format(field), "MAX({0}_max)".format(field), "TOTAL({0}_sum)".format(field)])
+            updates.extend([
+                "{0}_min = MIN(COALESCE({0}_min, excluded.{0}_min), COALESCE(excluded.{0}_min, {0}_min))".format(field),
+                "{0}_max = MAX(COALESCE({0}_max, excluded.{0}_max), COALESCE(excluded.{0}_max, {0}_max))".format(field),
+                "{0}_sum = {0}_sum + excluded.{0}_sum".format(field),
+            ])
+
+        sqlite.execute("CREATE TEMP TABLE IF NOT EXISTS rollup_batch (" + ", ".join(columns) + ")")
+        sqlite.execute("DELETE FROM temp.rollup_batch")
+
+        resolution = self.rollup_resolutions[0]
+        # without NOT INDEXED whole session is scanned by its index, only rowid range of new rows is needed
+        sqlite.execute((
+            "INSERT INTO temp.rollup_batch "
+            "SELECT session_id, :resolution, CAST(timestamp / :resolution AS INTEGER) * :resolution, "
+            "COUNT(id), " + ", ".join(aggregates) + " "
+            "FROM measurements NOT INDEXED "
+            "WHERE id > :first_id AND session_id IS NOT NULL AND timestamp IS NOT NULL "
+            "GROUP BY session_id, CAST(timestamp / :resolution AS INTEGER)"
+        ), {"resolution": resolution, "first_id": first_id})
+
+        # resolutions are multiples of each other, so buckets nest
+        for previous, resolution in zip(self.rollup_resolutions, self.rollup_resolutions[1:]):
+            sqlite.execute((
+                "INSERT INTO temp.rollup_batch "
+                "SELECT session_id, :resolution, CAST(bucket / :resolution AS INTEGER) * :resolution, "
+                "SUM(samples), " + ", ".join(merges) + " "
+                "FROM temp.rollup_batch "
+                "WHERE resolution = :previous "
+                "GROUP BY session_id, CAST(bucket / :resolution AS INTEGER)"
+            ), {"resolution": resolution, "previous": previous})
+
+        sqlite.execute((
+            "INSERT INTO measurements_rollup "
+            "SELECT * FROM temp.rollup_batch WHERE true "
+            "ON CONFLICT (session_id, resolution, bucket) DO UPDATE SET " + ", ".join(updates)
+        ))
+        sqlite.execute("DELETE FROM temp.rollup_batch")
 
     def destroy_measurements(self, session):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("DELETE FROM measurements WHERE session_id = ?", (session,))
+            cursor.execute("DELETE FROM measurements_rollup WHERE session_id = ?", (session,))
             cursor.execute("DELETE FROM sessions WHERE id = ?", (session,))
+        self.baselines.pop((self.parameters["database"], session), None)
 
     def fetch_sessions(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             return cursor.execute("SELECT * FROM sessions ORDER BY timestamp DESC").fetchall()
 
     def fetch_measurements_count(self, session):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
-            cursor.execute("SELECT COUNT(id) AS count FROM measurements WHERE session_id = ?", (session,))
-            return int(cursor.fetchone()["count"])
+            cursor.execute("SELECT measurements FROM sessions WHERE id = ?", (session,))
+            row = cursor.fetchone()
+            return int(row["measurements"] or 0) if row else 0
 
-    def fetch_measurements(self, session, limit=None, offset=None, zeroed=False):
-        with closing(self.connect()) as sqlite:
+    def fetch_measurements(self, session, limit=None, offset=None, zeroed=False, begin=None, end=None, after=None):
+        columns, parameters = self.prepare_columns(session, zeroed)
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
-            sql = "SELECT * FROM measurements WHERE session_id = ? ORDER BY timestamp ASC"
-            if limit is None or offset is None:
-                cursor.execute(sql, (session,))
-            else:
-                cursor.execute(sql + " LIMIT ?, ?", (session, offset, limit))
+            sql = "SELECT " + columns + " FROM measurements WHERE session_id = ?"
+            parameters.append(session)
+            if after is not None:
+                sql += " AND id > ?"
+                parameters.append(after)
+            if begin is not None:
+                sql += " AND timestamp >= ?"
+                parameters.append(begin)
+            if end is not None:
+                sql += " AND timestamp <= ?"
+                parameters.append(end)
+            sql += " ORDER BY timestamp ASC, id ASC"
+            if limit is not None and offset is not None:
+                sql += " LIMIT ?, ?"
+                parameters.extend((offset, limit))
+            cursor.execute(sql, parameters)
             items = cursor.fetchall()
 
         for index, item in enumerate(items):
             items[index] = self.converter.convert(item)
 
-        if zeroed:
-            self.fill_zeroed_accumulated_fields_for_measurements(session, items)
+        return items
+
+    def fetch_measurements_page(self, session, limit, after=None, before=None, zeroed=False):
+        """
+        Keyset pagination, after and before are (timestamp, id) of the last/first measurement of adjacent page.
+        Unlike offset it doesn't need to skip all preceding measurements, so deep pages are as fast as first one.
+        """
+        columns, parameters = self.prepare_columns(session, zeroed)
+        sql = "SELECT " + columns + " FROM measurements WHERE session_id = ?"
+        parameters.append(session)
+        if after is not None:
+            sql += " AND (timestamp, id) > (?, ?) ORDER BY timestamp ASC, id ASC"
+            parameters.extend(after)
+        elif before is not None:
+            sql += " AND (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC"
+            parameters.extend(before)
+        else:
+            sql += " ORDER BY timestamp ASC, id ASC"
+        sql += " LIMIT ?"
+        parameters.append(limit)
+
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.execute(sql, parameters)
+            items = cursor.fetchall()
+
+        if after is None and before is not None:
+            items.reverse()
+
+        for index, item in enumerate(items):
+            items[index] = self.converter.convert(item)
 
         return items
 
-    def fill_zeroed_accumulated_fields_for_measurements(self, session, measurements):
-        first_measurements = self.fetch_measurements(session, 1, 0)
-        first_measurement = first_measurements[0] if len(first_measurements) else None
-        for item in measurements:
-            for name, value in list(item.items()):
-                if name.startswith("accumulated_"):
-                    zeroed_name = "zeroed_%s" % name
-                    if name not in first_measurement or first_measurement[name] is None:
-                        item[zeroed_name] = None
-                    else:
-                        item[zeroed_name] = value - first_measurement[name]
+    def fetch_columns(self, session, columns, begin=None, end=None, after=None, arrays=False):
+        """
+        Reads only given columns as plain tuples (or list per column when arrays is True) without building
+        dictionary for every row. Besides measurement columns also current-m and zeroed_* can be requested.
+        """
+        expressions = []
+        parameters = []
+        converted = []
+        for index, column in enumerate(columns):
+            if column in self.measurement_columns:
+                expressions.append(column)
+            elif column == "current-m":
+                expressions.append("current")
+                converted.append(index)
+            elif isinstance(column, str) and column.startswith("zeroed_") and column[7:] in self.accumulated_fields:
+                baseline = self.fetch_baseline(session)
+                expressions.append("%s - ?" % column[7:])
+                parameters.append(baseline[column[7:]] if baseline else None)
+            else:
+                raise ValueError("unknown measurement column: %s" % column)
+
+        sql = "SELECT " + ", ".join(expressions) + " FROM measurements WHERE session_id = ?"
+        parameters.append(session)
+        if after is not None:
+            sql += " AND id > ?"
+            parameters.append(after)
+        if begin is not None:
+            sql += " AND timestamp >= ?"
+            parameters.append(begin)
+        if end is not None:
+            sql += " AND timestamp <= ?"
+            parameters.append(end)
+        sql += " ORDER BY timestamp ASC, id ASC"
+
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.row_factory = None
+            cursor.execute(sql, parameters)
+            rows = cursor.fetchall()
+
+        if converted:
+            # same as Converter.convert
+            for row_index, row in enumerate(rows):
+                row = list(row)
+                for index in converted:
+                    if row[index] is not None:
+                        row[index] = round(row[index] * 1000)
+                rows[row_index] = tuple(row)
+
+        if arrays:
+            if not rows:
+                return [[] for _ in columns]
+            return [list(values) for values in zip(*rows)]
+
+        return rows
+
+    def load_arrays(self, session, columns, begin=None, end=None, after=None):
+        """
+        Loads measurements into NumPy, one contiguous float64 array per column, missing values are NaN.
+        Besides numeric measurement columns also current-m, zeroed_* and run_time can be requested,
+        these are computed from whole arrays at once.
+        """
+        if numpy is None:
+            raise RuntimeError("NumPy is not installed")
+
+        sources = []
+        for column in columns:
+            if column == "current-m":
+                required = ["current"]
+            elif isinstance(column, str) and column.startswith("zeroed_") and column[7:] in self.accumulated_fields:
+                required = [column[7:]]
+            elif column == "run_time":
+                required = ["timestamp", "resistance"]
+            elif column in self.measurement_columns and column not in ["name", "mode_name"]:
+                required = [column]
+            else:
+                raise ValueError("unknown measurement column: %s" % column)
+
+            for name in required:
+                if name not in sources:
+                    sources.append(name)
+
+        sql = "SELECT " + ", ".join(sources) + " FROM measurements WHERE session_id = ?"
+        parameters = [session]
+        if after is not None:
+            sql += " AND id > ?"
+            parameters.append(after)
+        if begin is not None:
+            sql += " AND timestamp >= ?"
+            parameters.append(begin)
+        if end is not None:
+            sql += " AND timestamp <= ?"
+            parameters.append(end)
+        sql += " ORDER BY timestamp ASC, id ASC"
+
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.row_factory = None
+            cursor.execute(sql, parameters)
+            # None is converted to NaN, transposed copy makes every column contiguous
+            matrix = numpy.array(cursor.fetchall(), dtype=numpy.float64).reshape(-1, len(sources)).T.copy()
+
+        arrays = {}
+        for index, name in enumerate(sources):
+            arrays[name] = matrix[index]
+
+        for column in columns:
+            if column == "current-m":
+                self.converter.convert_arrays(arrays)
+            elif column.startswith("zeroed_"):
+                baseline = self.fetch_baseline(session)
+                value = baseline[column[7:]] if baseline else None
+                arrays[column] = arrays[column[7:]] - (numpy.nan if value is None else value)
+            elif column == "run_time":
+                arrays[column] = self.converter.run_time(arrays["timestamp"], arrays["resistance"])
+
+        return arrays
+
+    def fetch_statistics(self, session):
+        fields = ["voltage", "current", "power", "temperature", "resistance"]
+        accumulated = ["zeroed_%s" % field for field in self.accumulated_fields]
+        arrays = self.load_arrays(session, ["timestamp", "run_time"] + fields + accumulated)
+
+        timestamp = arrays["timestamp"]
+        statistics = {
+            "count": len(timestamp),
+            "duration": float(timestamp[-1] - timestamp[0]) if len(timestamp) else 0,
+            "run_time": float(arrays["run_time"][-1]) if len(timestamp) else 0,
+        }
+
+        for field in fields:
+            values = arrays[field][~numpy.isnan(arrays[field])]
+            if len(values):
+                statistics[field] = {
+                    "min": float(values.min()),
+                    "max": float(values.max()),
+                    "avg": float(values.mean()),
+                }
+            else:
+                statistics[field] = None
+
+        for field in accumulated:
+            values = arrays[field][~numpy.isnan(arrays[field])]
+            statistics[field] = float(values[-1]) if len(values) else None
+
+        return statistics
+
+    def prepare_columns(self, session, zeroed):
+        if not zeroed:
+            return "*", []
+
+        # zeroed values are computed by sqlite against baseline, no need for another pass in Python
+        baseline = self.fetch_baseline(session)
+        columns = ["*"]
+        parameters = []
+        for field in self.accumulated_fields:
+            columns.append("%s - ? AS zeroed_%s" % (field, field))
+            parameters.append(baseline[field] if baseline else None)
+        return ", ".join(columns), parameters
+
+    def fetch_baseline(self, session):
+        key = (self.parameters["database"], session)
+        baseline = self.baselines.get(key)
+        if baseline is None:
+            with self.pool.connection() as sqlite:
+                cursor = sqlite.cursor()
+                cursor.execute((
+                    "SELECT " + ", ".join(self.accumulated_fields) + " FROM measurements "
+                    "WHERE session_id = ? ORDER BY timestamp ASC, id ASC LIMIT 1"
+                ), (session,))
+                baseline = cursor.fetchone()
+
+            # first measurement doesn't change once written, empty session isn't cached
+            if baseline is not None:
+                self.baselines[key] = baseline
+
+        return baseline
+
+    def fetch_measurements_range(self, session):
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.execute((
+                "SELECT MIN(timestamp) AS begin, MAX(timestamp) AS end FROM measurements WHERE session_id = ?"
+            ), (session,))
+            return cursor.fetchone()
+
+    def estimate_measurements_count(self, session, begin=None, end=None):
+        # buckets on range edges are counted whole, so rollup is chosen to have range span at least 100 of them
+        # (estimate is then off by few percent at most), finest rollup is used for short ranges
+        resolution = self.rollup_resolutions[0]
+        for candidate in self.rollup_resolutions:
+            if begin is None or end is None or candidate * 100 <= end - begin:
+                resolution = candidate
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            sql = "SELECT TOTAL(samples) AS count FROM measurements_rollup WHERE session_id = ? AND resolution = ?"
+            parameters = [session, resolution]
+            if begin is not None:
+                sql += " AND bucket >= ?"
+                parameters.append(int(begin // resolution) * resolution)
+            if end is not None:
+                sql += " AND bucket <= ?"
+                parameters.append(end)
+            cursor.execute(sql, parameters)
+            return int(cursor.fetchone()["count"])
+
+    def fetch_rollups(self, session, resolution, begin=None, end=None):
+        columns = ["bucket", "samples"]
+        for field in self.rollup_fields:
+            columns.extend([
+                "%s_min" % field,
+                "%s_max" % field,
+                "CASE WHEN {0}_min IS NULL THEN NULL ELSE {0}_sum / samples END AS {0}_avg".format(field),
+            ])
+
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            sql = "SELECT " + ", ".join(columns) + " FROM measurements_rollup WHERE session_id = ? AND resolution = ?"
+            parameters = [session, resolution]
+            if begin is not None:
+                sql += " AND bucket >= ?"
+                parameters.append(int(begin // resolution) * resolution)
+            if end is not None:
+                sql += " AND bucket <= ?"
+                parameters.append(end)
+            sql += " ORDER BY bucket ASC"
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+
+    def iterate_measurements(self, session, zeroed=False, chunk_size=1000):
+        """
+        Same as fetch_measurements but measurements are read from cursor in chunks and yielded one by one,
+        memory usage doesn't depend on session size.
+        """
+        columns, parameters = self.prepare_columns(session, zeroed)
+        parameters.append(session)
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.execute(
+                "SELECT " + columns + " FROM measurements WHERE session_id = ? ORDER BY timestamp ASC, id ASC", parameters
+            )
+            while True:
+                items = cursor.fetchmany(chunk_size)
+                if not items:
+                    break
+
+                for item in items:
+                    yield self.converter.convert(item)
 
     def fetch_last_measurement_by_name(self, name):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("SELECT * FROM measurements WHERE name = ? ORDER BY timestamp DESC LIMIT 1", (name,))
             return cursor.fetchone()
 
+    def fetch_last_measurement_id(self, session):
+        with self.pool.connection() as sqlite:
+            cursor = sqlite.cursor()
+            cursor.execute((
+                "SELECT id, timestamp FROM measurements WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT 1"
+            ), (session,))
+            return cursor.fetchone()
+
     def fetch_last_measurement(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("SELECT * FROM measurements ORDER BY timestamp DESC LIMIT 1")
             return cursor.fetchone()
 
     def get_selected_session(self, selected):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             if selected == "":
                 session = cursor.execute("SELECT * FROM sessions ORDER BY timestamp DESC LIMIT 1").fetchone()
@@ -220,12 +851,12 @@ class Storage:
         return session
 
     def log(self, message):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("INSERT INTO logs (message) VALUES (?)", (message,))
 
     def fetch_log(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("SELECT message FROM logs")
 
@@ -236,29 +867,143 @@ class Storage:
         return log
 
     def clear_log(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("DELETE FROM logs WHERE id NOT IN (SELECT id FROM logs ORDER BY id DESC LIMIT 250)")
 
     def update_status(self, status):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("UPDATE status SET status = ?", (status,))
 
     def fetch_status(self):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("SELECT status FROM status")
             return cursor.fetchone()["status"]
 
     def create_session(self, name, version):
-        with closing(self.connect()) as sqlite:
+        with self.pool.connection() as sqlite:
             cursor = sqlite.cursor()
             cursor.execute("INSERT INTO sessions (name, version, timestamp) VALUES (?, ?, ?)", (name, version, time()))
             return cursor.lastrowid
 
+    def checkpoint(self, mode="PASSIVE"):
+        with self.pool.connection() as sqlite:
+            return sqlite.execute("PRAGMA wal_checkpoint(%s)" % mode).fetchone()
+
     def backup(self):
         path = self.parameters["database"]
         backup_path = "%s.backup-%s" % (path, pendulum.now().format("YYYY-MM-DD_HH-mm-ss"))
         if os.path.exists(path):
-            shutil.copy(path, backup_path)
+            # file copy would miss changes not yet checkpointed from WAL
+            with self.pool.connection() as sqlite, closing(sqlite3.connect(backup_path)) as target:
+                sqlite.backup(target)
+
+
+class MeasurementWriter(QueueWorker):
+    """
+    Stores measurements in background thread, measurements are queued and committed in batches
+    """
+    name = "measurement writer"
+    reported_fields = ["dropped", "late", "failed"]
+
+    def __init__(self, storage, queue_size=10000, batch_size=500, flush_interval=1.0, late_threshold=10.0,
+                 checkpoint_interval=Storage.DEFAULT_CHECKPOINT_INTERVAL, on_report=None):
+        super().__init__(queue_size, batch_size, on_report)
+        self.storage = storage
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_expiration = time() + checkpoint_interval
+        self.flush_interval = flush_interval
+        self.late_threshold = late_threshold
+        self.stored = 0
+        self.late = 0
+        # log lines have own queue, so they never take place of measurements
+        self.logs = Queue(queue_size)
+        self.messages = []
+
+    def put(self, data):
+        if data is None:
+            return True
+        return super().put((time(), data))
+
+    def log(self, message):
+        """
+        Log message stored together with next batch, it is silently skipped when its queue is full
+        """
+        try:
+            self.logs.put_nowait(message)
+            return True
+        except Full:
+            return False
+
+    def run(self):
+        batch = []
+        deadline = time() + self.flush_interval
+        while self.running or not self.queue.empty() or batch or self.messages or not self.logs.empty():
+            self.collect(batch, max(0.0, deadline - time()))
+
+            if len(batch) >= self.batch_size or deadline <= time() or not self.running:
+                if batch or self.messages or not self.logs.empty():
+                    batch = self.flush(batch)
+                deadline = time() + self.flush_interval
+                self.report()
+                self.checkpoint()
+
+        self.checkpoint(force=True)
+
+    def checkpoint(self, force=False):
+        # WAL is checkpointed automatically, but long reads can postpone it, so we
+        # checkpoint explicitly and truncate WAL file at the end of capture
+        if self.checkpoint_interval <= 0 and not force:
+            return
+        if not force and self.checkpoint_expiration > time():
+            return
+        self.checkpoint_expiration = time() + self.checkpoint_interval
+
+        try:
+            self.storage.checkpoint("TRUNCATE" if force else "PASSIVE")
+        except sqlite3.Error as e:
+            logging.warning("WAL checkpoint failed: %s" % e)
+
+    def flush(self, batch):
+        begin = time()
+        while len(self.messages) < self.logs.maxsize:
+            try:
+                self.messages.append(self.logs.get_nowait())
+            except Empty:
+                break
+
+        try:
+            self.storage.store_measurements([data for queued, data in batch], self.messages)
+        except Exception as e:
+            logging.exception(e)
+            self.failed += 1
+            if not self.running:
+                self.dropped += len(batch)
+                self.messages = []
+                return []
+            # keep batch for next flush, unless it grows over queue capacity
+            overflow = len(batch) - self.queue.maxsize
+            if overflow > 0:
+                self.dropped += overflow
+                batch = batch[overflow:]
+            return batch
+
+        self.messages = []
+        for queued, data in batch:
+            if begin - queued > self.late_threshold:
+                self.late += 1
+        self.stored += len(batch)
+        return []
+
+    def stats(self):
+        stats = super().stats()
+        stats["stored"] = self.stored
+        stats["late"] = self.late
+        return stats
+
+    def format_report(self, stats):
+        return "measurement writer: %s stored, %s dropped, %s late (over %s seconds), %s failed writes" % (
+            stats["stored"], stats["dropped"], stats["late"], self.late_threshold, stats["failed"]
+        )
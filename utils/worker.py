@@ -0,0 +1,94 @@
+import logging
+from queue import Empty, Full, Queue
+from threading import Thread
+from time import time
+
+
+class QueueWorker:
+    """
+    Consumes queued items in background thread, subclasses implement run() using collect().
+    Queue is bounded, put() never blocks the caller (acquisition loop), items that don't fit are dropped
+    and counted. Counters listed in reported_fields are logged (and passed to on_report) when they change.
+    """
+    REPORT_INTERVAL = 60
+
+    name = "worker"
+    reported_fields = ["dropped", "failed"]
+    thread = None
+
+    def __init__(self, queue_size, batch_size, on_report=None):
+        self.queue = Queue(queue_size)
+        self.batch_size = batch_size
+        self.on_report = on_report
+        self.running = False
+        self.dropped = 0
+        self.failed = 0
+        self.reported = dict.fromkeys(self.reported_fields, 0)
+        self.report_expiration = time() + self.REPORT_INTERVAL
+
+    def start(self):
+        self.running = True
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = Thread(target=self.run, name=self.name, daemon=True)
+            self.thread.start()
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=30):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout)
+            if self.thread.is_alive():
+                logging.warning("%s did not finish in %s seconds" % (self.name, timeout))
+            self.thread = None
+        self.report(force=True)
+
+    def run(self):
+        raise NotImplementedError()
+
+    def collect(self, batch, timeout):
+        """
+        Appends whatever is queued to batch (up to batch_size), waits up to timeout for the first item
+        """
+        try:
+            batch.append(self.queue.get(timeout=timeout))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        return batch
+
+    def stats(self):
+        return {
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "queued": self.queue.qsize(),
+        }
+
+    def report(self, force=False):
+        if not force and self.report_expiration > time():
+            return
+        self.report_expiration = time() + self.REPORT_INTERVAL
+
+        stats = self.stats()
+        changed = False
+        for name in self.reported_fields:
+            if stats[name] != self.reported[name]:
+                changed = True
+            self.reported[name] = stats[name]
+        if not changed:
+            return
+
+        message = self.format_report(stats)
+        logging.warning(message)
+        if self.on_report:
+            self.on_report(message)
+
+    def format_report(self, stats):
+        return "%s: %s" % (self.name, ", ".join("%s %s" % (stats[name], name) for name in self.reported_fields))
@@ -36,6 +36,12 @@ def parse_cli(open_browser=True, webview=False):
                         help="Listen on address of specific interface (defaults to all interfaces)")
     parser.add_argument("--on-receive", help="Call this program/script when new measurements are received")
     parser.add_argument("--on-receive-interval", type=int, default=60, help="Interval for --on-receive (in seconds)")
+    parser.add_argument("--on-receive-mode", choices=["file", "stream"], default="file",
+                        help="Call --on-receive with JSON file for every batch (file) or keep it running "
+                             "and send batches to its stdin as JSON lines (stream)")
+    parser.add_argument("--sink", action="append", default=[],
+                        help="Send new measurements to python sink, specified as module:Class,option=value "
+                             "(e.g. utils.sinks:CsvSink,path=measurements.csv), can be used multiple times")
     parser.add_argument("--data-dir", type=str, help="Where to store configuration and user data files")
     if webview:
         parser.add_argument("--disable-gpu", action="store_true", default=False, help="Disable GPU rendering")
@@ -110,7 +116,7 @@ def run(args=None, embedded=False, webview=None):
         if len(prefix) > 1:
             socketio_path = prefix[1:] + "/" + socketio_path
         app.wsgi_app = socketio.Middleware(sockets, app.wsgi_app, socketio_path=socketio_path)
-        sockets.register_namespace(Backend(args.on_receive, args.on_receive_interval))
+        sockets.register_namespace(Backend(args.on_receive, args.on_receive_interval, args.on_receive_mode, args.sink))
 
         if not embedded:
             def open_in_browser():
@@ -131,6 +137,8 @@ def run(args=None, embedded=False, webview=None):
 
     except Exception as e:
         logging.exception(e)
+    finally:
+        Storage.close_all()
 
 
 if __name__ == "__main__":
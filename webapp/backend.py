@@ -5,9 +5,8 @@ import os
 import re
 import subprocess
 import sys
-from threading import Thread
+from threading import Lock, Thread
 from time import time, sleep
-from timeit import default_timer as timer
 import traceback
 
 import bluetooth
@@ -21,15 +20,31 @@ from interfaces.wrapper import Wrapper
 from utils.config import Config
 from utils.converter import Converter
 from utils.formatting import Format
-from utils.storage import Storage
+from utils.on_receive import OnReceiveWorker
+from utils.scheduler import TickScheduler
+from utils.sinks import SinkWorker, parse_sink
+from utils.storage import MeasurementWriter, Storage
+from webapp.jobs import ImportManager
 
 
 class Backend(Namespace):
+    instance = None
     config = None
+    writer = None
+    writer_users = 0
 
-    def __init__(self, on_receive, on_receive_interval):
+    def __init__(self, on_receive, on_receive_interval, on_receive_mode="file", sinks=None):
         super().__init__()
-        self.daemon = Daemon(self, on_receive, on_receive_interval)
+        self.on_receive = on_receive
+        self.on_receive_interval = on_receive_interval
+        self.on_receive_mode = on_receive_mode
+        # sink classes and their options, invalid --sink fails here on startup
+        self.sinks = [parse_sink(spec) for spec in sinks or []]
+        self.daemon = Daemon(self, on_receive, on_receive_interval, on_receive_mode=on_receive_mode, sinks=self.sinks)
+        self.daemons = {}
+        self.writer_lock = Lock()
+        ImportManager.backend = self
+        Backend.instance = self
         self.handle_auto_connect()
 
     def handle_auto_connect(self):
@@ -48,6 +63,13 @@ class Backend(Namespace):
         if isinstance(data, str):
             data = json.loads(data)
 
+        if "device" in data:
+            daemon = self.get_daemon(data["device"])
+            if daemon:
+                daemon.emit("connecting")
+                daemon.start()
+            return
+
         self.config.write("version", data["version"])
 
         if "port" in data:
@@ -179,11 +201,79 @@ class Backend(Namespace):
             logging.exception(e)
             self.emit("scan-result", traceback.format_exc())
 
-    def on_close(self, sid):
+    def on_cancel_import(self, sid):
+        ImportManager().cancel()
+
+    def on_close(self, sid, device=None):
         self.init()
+        if device:
+            daemon = self.daemons.get(device)
+            if daemon:
+                daemon.emit("disconnecting")
+                daemon.stop()
+            return
+
         self.emit("disconnecting")
         self.daemon.stop()
 
+    def on_join(self, sid, device):
+        daemon = self.get_daemon(device)
+        if daemon:
+            self.enter_room(sid, daemon.room)
+            self.emit("device-status", json.dumps({"device": device, "data": daemon.status}), to=sid)
+
+    def get_daemon(self, device):
+        """
+        Daemon of device profile from "devices" config, every profile has its own device process and session
+        """
+        profile = None
+        for item in Config().read("devices", []):
+            if item["id"] == device:
+                profile = item
+
+        daemon = self.daemons.get(device)
+        if profile is None:
+            return daemon
+
+        if daemon is None:
+            daemon = self.daemons[device] = Daemon(
+                self, self.on_receive, self.on_receive_interval, profile, self.on_receive_mode, self.sinks
+            )
+        elif not daemon.running:
+            daemon.profile = profile
+
+        return daemon
+
+    def remove_daemon(self, device):
+        """
+        Forgets daemon of removed device profile, refused while device is connected
+        """
+        daemon = self.daemons.get(device)
+        if daemon is not None and daemon.status != "disconnected":
+            return False
+        self.daemons.pop(device, None)
+        return True
+
+    def acquire_writer(self, checkpoint_interval, on_report):
+        """
+        One writer is shared by all connected devices
+        """
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = MeasurementWriter(Storage(), checkpoint_interval=checkpoint_interval, on_report=on_report)
+                self.writer.start()
+            self.writer_users += 1
+            return self.writer
+
+    def release_writer(self):
+        with self.writer_lock:
+            self.writer_users -= 1
+            if self.writer_users <= 0:
+                self.writer_users = 0
+                if self.writer:
+                    self.writer.close()
+                    self.writer = None
+
     def emit(self, event, data=None, to=None, room=None, skip_sid=None, namespace=None, callback=None):
         if self.server is None:
             return
@@ -193,23 +283,35 @@ class Backend(Namespace):
 class Daemon:
     DEFAULT_TIMEOUT = 60
     DEFAULT_RETRY_COUNT = 10
+    DEFAULT_SAMPLING_POLICY = TickScheduler.SKIP
+    STATS_INTERVAL = 60
+    MAX_ON_RECEIVE_BUFFER = 100000
 
     running = None
     thread = None
     storage = None
+    writer = None
+    status = "disconnected"
     config = None
     interface = None
     buffer = None
     buffer_expiration = None
+    on_receive_worker = None
+    sink_workers = None
     timeout = None
     retry_count = None
 
-    def __init__(self, backend, on_receive, on_receive_interval):
+    def __init__(self, backend, on_receive, on_receive_interval, profile=None, on_receive_mode="file", sinks=None):
         self.backed = backend
         self.on_receive = on_receive
         self.on_receive_interval = on_receive_interval
+        self.on_receive_mode = on_receive_mode
+        self.sinks = sinks or []
+        self.profile = profile
+        self.device = profile["id"] if profile else None
+        self.room = "device-%s" % self.device if profile else None
         self.storage = Storage()
-        if self.storage.fetch_status() != "disconnected":
+        if profile is None and self.storage.fetch_status() != "disconnected":
             self.storage.update_status("disconnected")
         self.loop = asyncio.new_event_loop()
         self.converter = Converter()
@@ -235,42 +337,57 @@ class Daemon:
         self.storage = Storage()
         self.config = Config()
 
-        self.interface = Wrapper()
+        self.interface = Wrapper(self.profile)
 
         setup = self.config.read("setup")
         self.timeout = self.parse_setup_option(setup, "timeout", int, self.DEFAULT_TIMEOUT)
         self.retry_count = self.parse_setup_option(setup, "retry_count", int, self.DEFAULT_RETRY_COUNT)
+        policy = self.parse_setup_option(setup, "sampling_policy", str, self.DEFAULT_SAMPLING_POLICY)
+
+        checkpoint_interval = self.parse_setup_option(
+            setup, "database_checkpoint_interval", int, Storage.DEFAULT_CHECKPOINT_INTERVAL
+        )
+        self.writer = self.backed.acquire_writer(checkpoint_interval, self.log)
 
         try:
+            self.open_sinks()
             self.log("Connecting")
             self.retry(self.interface.connect)
             self.emit("connected")
             self.log("Connected")
 
-            name = self.config.read("name")
-            interval = float(self.config.read("rate"))
-            version = self.config.read("version")
+            if self.profile:
+                name = "%s %s" % (self.profile["name"], pendulum.now().format("YYYY-MM-DD HH:mm"))
+                interval = float(self.profile["rate"])
+                version = self.profile["version"]
+            else:
+                name = self.config.read("name")
+                interval = float(self.config.read("rate"))
+                version = self.config.read("version")
             session_id = self.storage.create_session(name, version)
+            # device process reads samples on its own schedule, they are only consumed here
+            self.interface.stream(interval, policy)
+            stats_deadline = time() + self.STATS_INTERVAL
             while self.running:
-                begin = timer()
                 data = self.retry(self.interface.read)
 
+                if stats_deadline <= time():
+                    stats_deadline = time() + self.STATS_INTERVAL
+                    self.log(TickScheduler.format_stats(self.interface.stats()), queued=True)
+
                 if isinstance(data, str):
                     if data in ["disconnected", "connected"]:
                         self.disconnect()
                         return
                     raise Exception(data)
                 else:
-                    self.log(json.dumps(data))
+                    self.log(json.dumps(data), queued=True)
                     if data:
                         data["session_id"] = session_id
                         self.update(data, version)
-                    self.storage.store_measurement(data)
-
-                measurement_runtime = timer() - begin
-                sleep_time = interval - measurement_runtime
-                if sleep_time > 0:
-                    sleep(sleep_time)
+                        for worker in self.sink_workers:
+                            worker.put(dict(data))
+                    self.writer.put(data)
 
         except Exception as e:
             logging.exception(e)
@@ -281,10 +398,38 @@ class Daemon:
 
     def disconnect(self):
         self.interface.disconnect()
+        if self.interface.interval is not None:
+            self.log(TickScheduler.format_stats(self.interface.stats()))
+            self.interface.interval = None
+        self.interface.close()
+        if self.writer:
+            self.writer = None
+            self.backed.release_writer()
+        if self.on_receive_worker:
+            if self.buffer:
+                self.on_receive_worker.put(self.buffer)
+                self.buffer = None
+            self.on_receive_worker.close()
+            self.on_receive_worker = None
+        self.close_sinks()
         self.emit("disconnected")
         self.log("Disconnected")
         self.thread = None
 
+    def open_sinks(self):
+        self.sink_workers = []
+        for sink_class, options in self.sinks:
+            worker = SinkWorker(sink_class(**options))
+            worker.start(self.device)
+            self.sink_workers.append(worker)
+            self.log("Sink %s started" % type(worker.sink).__name__)
+
+    def close_sinks(self):
+        if self.sink_workers:
+            for worker in self.sink_workers:
+                worker.close()
+        self.sink_workers = None
+
     def update(self, data, version):
         format = Format(version)
 
@@ -318,7 +463,21 @@ class Daemon:
                     execute = True
                     self.buffer_expiration = time() + self.on_receive_interval
 
-            if execute:
+            if execute and self.on_receive_mode == "stream":
+                if self.on_receive_worker is None:
+                    self.on_receive_worker = OnReceiveWorker(self.on_receive)
+                    self.on_receive_worker.start()
+
+                if self.on_receive_worker.put(self.buffer):
+                    self.buffer = None
+                elif len(self.buffer) > self.MAX_ON_RECEIVE_BUFFER:
+                    # worker is behind, keep buffering for next interval but not indefinitely
+                    logging.warning("--on-receive process is not keeping up, dropping %s oldest measurements" % (
+                        len(self.buffer) - self.MAX_ON_RECEIVE_BUFFER
+                    ))
+                    self.buffer = self.buffer[-self.MAX_ON_RECEIVE_BUFFER:]
+
+            elif execute:
                 payload = json.dumps(self.buffer)
                 self.buffer = None
                 payload_file = os.path.join(os.getcwd(), "on-receive-payload-%s.json") % time()
@@ -333,10 +492,10 @@ class Daemon:
                 env["PYTHONPATH"] = ""
                 subprocess.Popen(command, shell=True, env=env)
 
-        self.emit("update", json.dumps({
+        self.emit("update", {
             "table": table,
             "graph": graph,
-        }))
+        })
 
     def retry(self, callback):
         timeout = self.timeout
@@ -387,12 +546,33 @@ class Daemon:
         if event == "log":
             self.storage.log(data)
         elif event in ["connecting", "connected", "disconnecting", "disconnected"]:
-            self.storage.update_status(event)
-        self.backed.emit(event, data)
+            self.status = event
+            if self.device is None:
+                self.storage.update_status(event)
 
-    def log(self, message):
+        self.send(event, data)
+
+    def send(self, event, data=None):
+        if self.device is None:
+            if event == "update":
+                data = json.dumps(data)
+            self.backed.emit(event, data)
+        else:
+            if event in ["connecting", "connected", "disconnecting", "disconnected"]:
+                event, data = "status", event
+            self.backed.emit("device-" + event, json.dumps({"device": self.device, "data": data}), room=self.room)
+
+    def log(self, message, queued=False):
         prefix = pendulum.now().format("YYYY-MM-DD HH:mm:ss") + " - "
-        self.emit("log", prefix + message + "\n")
+        if self.profile:
+            prefix += "[%s] " % self.profile["name"]
+        message = prefix + message + "\n"
+        if queued and self.writer:
+            # stored by writer thread, so acquisition loop doesn't wait for database
+            self.writer.log(message)
+            self.send("log", message)
+        else:
+            self.emit("log", message)
 
     def parse_setup_option(self, setup, name, data_type, default=None):
         if isinstance(setup, dict) and name in setup:
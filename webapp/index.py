@@ -1,35 +1,42 @@
 import csv
+import hashlib
 import io
 from math import ceil, floor
 import os
 import pathlib
 import re
-from time import time
 import traceback
 import typing
 from urllib.parse import quote
+import zlib
 
-from flask import url_for, request, jsonify, redirect, flash, make_response, current_app
+from flask import url_for, request, jsonify, redirect, flash, make_response, current_app, Response, \
+    stream_with_context
 from flask.blueprints import Blueprint
 from flask.templating import render_template
 import pendulum
 from werkzeug.utils import secure_filename
 
 from interfaces.tc import TcSerialInterface
+from utils import downsampling
 from utils.config import Config, static_path, get_data_path
 from utils.formatting import Format
+from utils.importer import CsvImporter, Tc66cImporter
+from utils.scheduler import TickScheduler
 from utils.storage import Storage
 from utils.version import version
-from webapp.backend import Daemon
+from webapp.backend import Backend, Daemon
+from webapp.jobs import ImportManager
 
 if typing.TYPE_CHECKING:
     from app import Webview
 
 
 class Index:
+    DEFAULT_GRAPH_POINTS = 5000
+
     config = None
     storage = None
-    import_in_progress = False
 
     def register(self):
         blueprint = Blueprint("index", __name__, template_folder="templates")
@@ -37,7 +44,9 @@ class Index:
         blueprint.add_url_rule("/data", "data", self.render_data)
         blueprint.add_url_rule("/graph", "graph", self.render_graph)
         blueprint.add_url_rule("/graph.json", "graph_data", self.render_graph_data)
+        blueprint.add_url_rule("/statistics.json", "statistics", self.render_statistics)
         blueprint.add_url_rule("/setup", "setup", self.render_setup, methods=["GET", "POST"])
+        blueprint.add_url_rule("/devices", "devices", self.render_devices, methods=["GET", "POST"])
         blueprint.add_url_rule("/rfcomm", "rfcomm", self.render_rfcomm)
         blueprint.add_url_rule("/ble", "ble", self.render_ble)
         blueprint.add_url_rule("/serial", "serial", self.render_serial)
@@ -105,61 +114,19 @@ class Index:
                     skip = not path
 
                 if not skip:
+                    rows = self.generate_csv(session["id"], format)
                     if path:
-                        file = open(path, "w", encoding="utf-8", newline="")
-                        writer = csv.writer(file)
-                        string = None
-                    else:
-                        file = None
-                        string = io.StringIO()
-                        writer = csv.writer(string)
-
-                    names = []
-                    for field in format.export_fields:
-                        names.append(format.field_name(field))
-                    writer.writerow(names)
-
-                    run_time_offset = None
-                    for item in self.storage.fetch_measurements(session["id"], zeroed=True):
-                        if run_time_offset is None and item["resistance"] < 9999.9:
-                            run_time_offset = item["timestamp"]
-
-                        rune_time = 0
-                        if run_time_offset is not None:
-                            rune_time = round(item["timestamp"] - run_time_offset)
-
-                        values = []
-                        for field in format.export_fields:
-                            if field == "time":
-                                values.append(format.time(item))
-                            elif field == "run_time":
-                                remaining = rune_time
-                                hours = floor(remaining / 3600)
-                                remaining -= hours * 3600
-                                minutes = floor(remaining / 60)
-                                remaining -= minutes * 60
-                                seconds = remaining
-                                parts = [
-                                    hours,
-                                    minutes,
-                                    seconds,
-                                ]
-                                for index, value in enumerate(parts):
-                                    parts[index] = str(value).zfill(2)
-                                values.append(":".join(parts))
-                            elif field == "run_time_seconds":
-                                values.append(rune_time)
-                            else:
-                                values.append(item[field])
-                        writer.writerow(values)
-
-                    if file:
-                        file.close()
+                        with open(path, "w", encoding="utf-8", newline="") as file:
+                            for chunk in rows:
+                                file.write(chunk)
                     else:
-                        output = make_response(string.getvalue())
-                        output.headers["Content-Disposition"] = "attachment; filename*=UTF-8''%s" % quote(file_name)
-                        output.headers["Content-type"] = "text/csv"
-                        return output
+                        headers = {
+                            "Content-Disposition": "attachment; filename*=UTF-8''%s" % quote(file_name),
+                        }
+                        if request.accept_encodings["gzip"]:
+                            rows = self.compress(rows)
+                            headers["Content-Encoding"] = "gzip"
+                        return Response(stream_with_context(rows), mimetype="text/csv", headers=headers)
 
             elif request.args.get("destroy") == "":
                 if selected == "":
@@ -171,11 +138,21 @@ class Index:
 
             page = request.args.get("page", 1, int)
             limit = 100
-            offset = limit * (page - 1)
             count = self.storage.fetch_measurements_count(session["id"])
-            pages = self.prepare_pages(session["id"], page, limit, count)
 
-            measurements = self.storage.fetch_measurements(session["id"], limit, offset, zeroed=True)
+            # adjacent pages are linked with cursor (timestamp and id of boundary measurement),
+            # other pages fall back to offset
+            after = self.parse_page_cursor(request.args.get("after"))
+            before = self.parse_page_cursor(request.args.get("before"))
+            if after or before:
+                measurements = self.storage.fetch_measurements_page(
+                    session["id"], limit, after=after, before=before, zeroed=True
+                )
+            else:
+                offset = limit * (page - 1)
+                measurements = self.storage.fetch_measurements(session["id"], limit, offset, zeroed=True)
+
+            pages = self.prepare_pages(session["id"], page, limit, count, measurements)
 
         return render_template(
             "data.html",
@@ -188,7 +165,77 @@ class Index:
             accumulated="zeroed" if request.cookies.get("accumulated") == "zeroed" else "actual"
         )
 
-    def prepare_pages(self, session_id, page, limit, count, blocks=10):
+    def generate_csv(self, session_id, format, chunk_size=1000):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        names = []
+        for field in format.export_fields:
+            names.append(format.field_name(field))
+        writer.writerow(names)
+
+        run_time_offset = None
+        for index, item in enumerate(self.storage.iterate_measurements(session_id, zeroed=True), start=1):
+            if run_time_offset is None and item["resistance"] < 9999.9:
+                run_time_offset = item["timestamp"]
+
+            rune_time = 0
+            if run_time_offset is not None:
+                rune_time = round(item["timestamp"] - run_time_offset)
+
+            values = []
+            for field in format.export_fields:
+                if field == "time":
+                    values.append(format.time(item))
+                elif field == "run_time":
+                    remaining = rune_time
+                    hours = floor(remaining / 3600)
+                    remaining -= hours * 3600
+                    minutes = floor(remaining / 60)
+                    remaining -= minutes * 60
+                    seconds = remaining
+                    parts = [
+                        hours,
+                        minutes,
+                        seconds,
+                    ]
+                    for part_index, value in enumerate(parts):
+                        parts[part_index] = str(value).zfill(2)
+                    values.append(":".join(parts))
+                elif field == "run_time_seconds":
+                    values.append(rune_time)
+                else:
+                    values.append(item[field])
+            writer.writerow(values)
+
+            if index % chunk_size == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        yield buffer.getvalue()
+
+    def compress(self, chunks):
+        compressor = zlib.compressobj(wbits=31)  # gzip container
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode("utf-8"))
+            if data:
+                yield data
+        yield compressor.flush()
+
+    def parse_page_cursor(self, value):
+        if not value:
+            return None
+        try:
+            timestamp, id = value.split(":")
+            return float(timestamp), int(id)
+        except ValueError:
+            return None
+
+    def format_page_cursor(self, item):
+        return "%r:%s" % (item["timestamp"], item["id"])
+
+    def prepare_pages(self, session_id, page, limit, count, measurements=None, blocks=10):
         first_page = 1
         related = 3
         last_page = int(ceil(count / limit))
@@ -202,9 +249,15 @@ class Index:
 
         pages = []
         for number in steps:
+            parameters = {}
+            if measurements and number == page - 1:
+                parameters["before"] = self.format_page_cursor(measurements[0])
+            elif measurements and number == page + 1:
+                parameters["after"] = self.format_page_cursor(measurements[-1])
+
             pages.append({
                 "number": number,
-                "link": url_for("index.data", page=number, session=session_id),
+                "link": url_for("index.data", page=number, session=session_id, **parameters),
                 "current": number == page,
             })
 
@@ -263,19 +316,145 @@ class Index:
         if self.config.read("colors") != colors:
             self.config.write("colors", colors, flush=True)
 
-        format = Format(session["version"] if session else None)
+        max_points = request.args.get("max_points", self.DEFAULT_GRAPH_POINTS, int)
+        mode = request.args.get("mode", "lttb")
+        if mode not in downsampling.modes:
+            mode = "lttb"
+
+        # visible range is in milliseconds, same as dates in returned data
+        begin = request.args.get("start", None, float)
+        if begin is not None:
+            begin /= 1000
+        end = request.args.get("end", None, float)
+        if end is not None:
+            end /= 1000
+
+        # cursor, only measurements stored after measurement with this id are returned
+        since = request.args.get("since", None, int)
+
+        last = None
+        if session:
+            last = self.storage.fetch_last_measurement_id(session["id"])
+            if last is not None:
+                etag = "%s-%s-%s" % (
+                    session["id"], last["id"], hashlib.sha1(request.query_string).hexdigest()[:16]
+                )
+                if request.if_none_match:
+                    not_modified = request.if_none_match.contains(etag)
+                else:
+                    modified_since = request.if_modified_since
+                    not_modified = modified_since and modified_since.timestamp() >= int(last["timestamp"])
+                if not_modified:
+                    response = make_response("", 304)
+                    response.set_etag(etag)
+                    return response
 
         data = []
         if session:
-            for item in self.storage.fetch_measurements(session["id"], zeroed=True):
-                if left_axis in item and right_axis in item:
-                    data.append({
-                        "date": format.timestamp(item),
-                        "left": item[left_axis],
-                        "right": item[right_axis],
-                    })
+            rows = None
+            if max_points > 0 and since is None:
+                rows = self.fetch_graph_rollups(session["id"], [left_axis, right_axis], begin, end, max_points, mode)
+
+            if rows is None:
+                try:
+                    rows = self.fetch_graph_rows(
+                        session["id"], [left_axis, right_axis], begin, end, since, max_points, mode
+                    )
+                except ValueError:
+                    rows = []
+
+            for timestamp, left, right in rows:
+                data.append({
+                    "date": timestamp * 1000,
+                    "left": left,
+                    "right": right,
+                })
+
+        response = jsonify(data)
+        response.headers["Cache-Control"] = "no-cache"
+        if last is not None:
+            response.set_etag(etag)
+            response.last_modified = pendulum.from_timestamp(last["timestamp"])
+            response.headers["X-Last-Id"] = str(last["id"])
+        return response
+
+    def fetch_graph_rows(self, session_id, fields, begin, end, since, max_points, mode):
+        columns = ["timestamp"] + fields
+        if not self.storage.arrays_supported:
+            rows = self.storage.fetch_columns(session_id, columns, begin=begin, end=end, after=since)
+            if max_points > 0:
+                rows = downsampling.downsample(rows, [1, 2], max_points, mode, x=0)
+            return rows
+
+        arrays = self.storage.load_arrays(session_id, columns, begin=begin, end=end, after=since)
+        timestamp = arrays["timestamp"]
+        series = [arrays[field] for field in fields]
+        if max_points > 0:
+            indexes = downsampling.downsample_arrays(timestamp, series, max_points, mode)
+            timestamp = timestamp[indexes]
+            series = [values[indexes] for values in series]
+
+        columns = [timestamp.tolist()]
+        for values in series:
+            # NaN isn't valid JSON
+            columns.append([None if value != value else value for value in values.tolist()])
+        return list(zip(*columns))
+
+    def render_statistics(self):
+        self.init()
 
-        return jsonify(data)
+        session = self.storage.get_selected_session(request.args.get("session", ""))
+        if not session:
+            return jsonify(None)
+
+        if not self.storage.arrays_supported:
+            return jsonify({"error": "NumPy is required for statistics"}), 501
+
+        return jsonify(self.storage.fetch_statistics(session["id"]))
+
+    def fetch_graph_rollups(self, session_id, fields, begin, end, max_points, mode):
+        sources = {}
+        for field in fields:
+            source = "current" if field == "current-m" else field
+            if source not in self.storage.rollup_fields:
+                return None
+            sources[field] = source
+
+        if self.storage.estimate_measurements_count(session_id, begin, end) <= max_points:
+            return None
+
+        if begin is None or end is None:
+            session_range = self.storage.fetch_measurements_range(session_id)
+            if session_range["begin"] is None:
+                return None
+            duration = (end if end is not None else session_range["end"])
+            duration -= (begin if begin is not None else session_range["begin"])
+        else:
+            duration = end - begin
+
+        resolution = self.storage.rollup_resolutions[-1]
+        for candidate in self.storage.rollup_resolutions:
+            if duration / candidate <= max_points:
+                resolution = candidate
+                break
+
+        # averages would flatten spikes, so every bucket is represented by its extremes
+        suffixes = ["min", "max"]
+        rows = []
+        for row in self.storage.fetch_rollups(session_id, resolution, begin, end):
+            for index, suffix in enumerate(suffixes):
+                values = [row["bucket"] + resolution * (index + 1) / (len(suffixes) + 1)]
+                for field in fields:
+                    value = row["%s_%s" % (sources[field], suffix)]
+                    if field == "current-m" and value is not None:
+                        value = round(value * 1000)
+                    values.append(value)
+                rows.append(tuple(values))
+
+        if mode != "minmax":
+            rows = downsampling.downsample(rows, list(range(1, len(fields) + 1)), max_points, mode, x=0)
+
+        return rows
 
     def prepare_selection(self):
         sessions = self.storage.fetch_sessions()
@@ -310,6 +489,13 @@ class Index:
             "auto_connect": "no",
             "timeout": Daemon.DEFAULT_TIMEOUT,
             "retry_count": Daemon.DEFAULT_RETRY_COUNT,
+            "sampling_policy": Daemon.DEFAULT_SAMPLING_POLICY,
+            "database_journal_mode": Storage.DEFAULT_JOURNAL_MODE,
+            "database_synchronous": Storage.DEFAULT_SYNCHRONOUS,
+            "database_cache_size": Storage.DEFAULT_CACHE_SIZE,
+            "database_mmap_size": Storage.DEFAULT_MMAP_SIZE,
+            "database_temp_store": Storage.DEFAULT_TEMP_STORE,
+            "database_checkpoint_interval": Storage.DEFAULT_CHECKPOINT_INTERVAL,
         }
 
         for name, default_value in defaults.items():
@@ -320,6 +506,8 @@ class Index:
             for name in defaults.keys():
                 setup[name] = request.form[name]
             self.config.write("setup", setup)
+            # new connections will be opened with updated database settings
+            Storage.close_all()
             flash("Settings were successfully saved", "success")
             return redirect(url_for("index.setup"))
 
@@ -329,6 +517,87 @@ class Index:
             page="setup",
             default_timeout=Daemon.DEFAULT_TIMEOUT,
             default_retry_count=Daemon.DEFAULT_RETRY_COUNT,
+            sampling_policies=TickScheduler.policies,
+            default_sampling_policy=Daemon.DEFAULT_SAMPLING_POLICY,
+            storage=Storage,
+        )
+
+    def render_devices(self):
+        self.init()
+        devices = self.config.read("devices", [])
+
+        messages = []
+        device = {
+            "name": "",
+            "version": self.config.read("version", "UM34C"),
+            "address": "",
+            "rate": 1.0,
+        }
+
+        if "delete" in request.form:
+            identifier = request.form.get("delete")
+            if Backend.instance is not None and not Backend.instance.remove_daemon(identifier):
+                flash("Device is connected, disconnect it before removing", "danger")
+                return redirect(url_for("index.devices"))
+
+            devices = [item for item in devices if item["id"] != identifier]
+            self.config.write("devices", devices)
+            flash("Device was removed", "success")
+            return redirect(url_for("index.devices"))
+
+        if "do" in request.form:
+            device["name"] = request.form.get("name", "").strip()
+            device["version"] = request.form.get("version")
+            device["address"] = request.form.get("address", "").strip()
+
+            if not device["name"]:
+                messages.append("Please provide device name")
+            if not device["address"]:
+                messages.append("Please provide port or address")
+
+            try:
+                device["rate"] = float(request.form.get("rate"))
+                if device["rate"] <= 0:
+                    raise ValueError
+            except (TypeError, ValueError):
+                messages.append("Rate has invalid value, please enter positive number of seconds")
+
+            if len(messages) == 0:
+                identifier = re.sub(r"[^a-z0-9]+", "-", device["name"].lower()).strip("-") or "device"
+                existing = [item["id"] for item in devices]
+                suffix = 1
+                while identifier in existing:
+                    suffix += 1
+                    identifier = re.sub(r"-[0-9]+$", "", identifier) + "-%s" % suffix
+
+                profile = {
+                    "id": identifier,
+                    "name": device["name"],
+                    "version": device["version"],
+                    "rate": device["rate"],
+                    "port": None,
+                    "rfcomm_address": None,
+                    "ble_address": None,
+                }
+                version = device["version"]
+                if version.startswith("TC") and not version.endswith("USB"):
+                    profile["ble_address"] = device["address"]
+                elif version.startswith("UM") and not version.endswith("Serial"):
+                    profile["rfcomm_address"] = device["address"]
+                else:
+                    profile["port"] = device["address"]
+
+                devices.append(profile)
+                self.config.write("devices", devices)
+                flash("Device was added", "success")
+                return redirect(url_for("index.devices"))
+
+        return render_template(
+            "devices.html",
+            devices=devices,
+            device=device,
+            messages=messages,
+            page="devices",
         )
 
     def render_rfcomm(self):
@@ -383,7 +652,11 @@ class Index:
                 if len(messages) == 0:
                     messages.extend(self.do_tc66c_import(session_name, period, calculate))
                     if len(messages) == 0:
-                        return redirect(url_for("index.graph"))
+                        return redirect(url_for("index.tc66c_import"))
+
+        job = ImportManager().collect("tc66c")
+        if job and job["state"] == "finished" and not job["messages"] and job["session_id"]:
+            return redirect(url_for("index.graph", session=job["session_id"]))
 
         return render_template(
             "tc66c-import.html",
@@ -391,75 +664,38 @@ class Index:
             session_name=session_name,
             period=period,
             calculate=calculate,
+            job=job,
             page="data"
         )
 
     def do_tc66c_import(self, name, period=1, calculate=False):
         messages = []
-        if self.import_in_progress:
-            messages.append("Import is already running")
-            return messages
-        self.import_in_progress = True
+        port = self.config.read("port")
         serial_timeout = int(self.config.read("serial_timeout", 10))
-        interface = TcSerialInterface(self.config.read("port"), serial_timeout)
-        self.storage.fetch_status()
-        try:
-            interface.connect()
-            begin = time()
-            previous_timestamp = None
-            accumulated_current = 0
-            accumulated_power = 0
-            session_id = None
-            for index, record in enumerate(interface.read_records()):
-                timestamp = begin + (index * period)
-
-                if session_id is None:
-                    session_id = self.storage.create_session(name, "TC66C recording")
-
-                data = {
-                    "timestamp": timestamp,
-                    "voltage": round(record["voltage"] * 10000) / 10000,
-                    "current": round(record["current"] * 100000) / 100000,
-                    "power": 0,
-                    "temperature": 0,
-                    "data_plus": 0,
-                    "data_minus": 0,
-                    "mode_id": 0,
-                    "mode_name": None,
-                    "accumulated_current": round(accumulated_current),
-                    "accumulated_power": round(accumulated_power),
-                    "accumulated_time": 0,
-                    "resistance": 0,
-                    "session_id": session_id,
-                }
-
-                if calculate:
-                    data["power"] = round(record["voltage"] * record["current"] * 1000) / 1000
-                    if record["current"] <= 0 and record["current"] >= 0:
-                        data["resistance"] = 9999.9
-                    else:
-                        data["resistance"] = round(record["voltage"] / record["current"] * 10) / 10
-                        if data["resistance"] > 9999.9:
-                            data["resistance"] = 9999.9
 
-                    if previous_timestamp is not None:
-                        delta = (timestamp - previous_timestamp) / 3600
-                        accumulated_current += (data["current"] * 1000) * delta
-                        accumulated_power += (data["power"] * 1000) * delta
+        def target(job):
+            return self.run_tc66c_import(job, port, serial_timeout, name, period, calculate)
 
-                self.storage.store_measurement(data)
+        if ImportManager().start("tc66c", name, target) is None:
+            messages.append("Import is already running")
 
-                previous_timestamp = timestamp
+        return messages
 
+    def run_tc66c_import(self, job, port, serial_timeout, name, period=1, calculate=False):
+        messages = []
+        storage = Storage()
+        interface = TcSerialInterface(port, serial_timeout)
+        try:
+            interface.connect()
+            messages.extend(Tc66cImporter(storage, job).run(interface, name, period, calculate))
         except Exception:
             message = "Failed to connect:"
             exception = traceback.format_exc()
-            self.storage.log(exception)
+            storage.log(exception)
             message += "\n%s" % exception
             messages.append(message)
         finally:
             interface.disconnect()
-            self.import_in_progress = False
 
         return messages
 
@@ -491,17 +727,27 @@ class Index:
             if len(messages) == 0:
                 messages.extend(self.do_csv_import(session_name, version, uploaded_file))
                 if len(messages) == 0:
-                    return redirect(url_for("index.graph"))
+                    return redirect(url_for("index.csv_import"))
+
+        job = ImportManager().collect("csv")
+        if job and job["state"] == "finished" and not job["messages"] and job["session_id"]:
+            return redirect(url_for("index.graph", session=job["session_id"]))
 
         return render_template(
             "csv-import.html",
             messages=messages,
             session_name=session_name,
             import_version=version,
+            job=job,
             page="data"
         )
 
     def do_csv_import(self, session_name, version, uploaded_file):
+        messages = []
+        if ImportManager().running():
+            messages.append("Import is already running")
+            return messages
+
         temp_dir = os.path.join(get_data_path(), "temp")
         if not os.path.exists(temp_dir):
             os.makedirs(temp_dir)
@@ -510,87 +756,21 @@ class Index:
         file_path = os.path.join(temp_dir, filename)
         uploaded_file.save(file_path)
 
-        messages = []
-        if self.import_in_progress:
+        def target(job):
+            return self.run_csv_import(job, file_path, session_name, version)
+
+        if ImportManager().start("csv", session_name, target) is None:
+            os.remove(file_path)
             messages.append("Import is already running")
-            return messages
-        self.import_in_progress = True
 
-        self.storage.fetch_status()
+        return messages
+
+    def run_csv_import(self, job, file_path, session_name, version):
         try:
             with open(file_path, "r", encoding="utf-8") as file:
-                csv_reader = csv.reader(file, delimiter=",")
-
-                header_expected = True
-                mapping: dict = {}
-                format = Format(version)
-                session_id = None
-                row_number = 0
-                chunk = []
-                for row in csv_reader:
-                    row_number += 1
-                    if header_expected:
-                        header_expected = False
-                        index = 0
-                        for name in row:
-                            field = format.field_name_reverse(name)
-                            if field is not None:
-                                mapping[field] = index
-                            index += 1
-
-                        if "time" not in mapping:
-                            messages.append(
-                                "Invalid CSV layout: time column not found, make sure your column names are correct"
-                            )
-                            return messages
-                    else:
-                        if session_id is None:
-                            session_id = self.storage.create_session(session_name, version)
-
-                        time_index = mapping["time"]
-                        try:
-                            time = pendulum.from_format(row[time_index], format.time_format)
-                        except ValueError:
-                            messages.append("Warning: unable to parse time: %s, skipping row: %s" % (
-                                row[time_index], row_number
-                            ))
-                            continue
-
-                        data = {
-                            "timestamp": time.timestamp(),
-                            "voltage": 0,
-                            "current": 0,
-                            "power": 0,
-                            "temperature": 0,
-                            "data_plus": 0,
-                            "data_minus": 0,
-                            "mode_id": 0,
-                            "mode_name": None,
-                            "accumulated_current": 0,
-                            "accumulated_power": 0,
-                            "accumulated_time": 0,
-                            "resistance": 0,
-                            "session_id": session_id,
-                        }
-                        for field in data.keys():
-                            if field in mapping:
-                                column_index = mapping[field]
-                                data[field] = float(row[column_index])
-
-                        chunk.append(data)
-
-                        if len(chunk) >= 1000:
-                            self.storage.store_measurements(chunk)
-                            chunk = []
-
-                if len(chunk):
-                    self.storage.store_measurements(chunk)
-
-            os.remove(file_path)
+                return CsvImporter(Storage(), version, job).run(file, session_name)
         finally:
-            self.import_in_progress = False
-
-        return messages
+            os.remove(file_path)
 
     def url_for(self, endpoint, **values):
         if endpoint == "static":
@@ -0,0 +1,123 @@
+import json
+import logging
+from threading import Event, Lock, Thread
+from time import time
+import traceback
+
+
+class ImportJob:
+    REPORT_INTERVAL = 0.5
+
+    def __init__(self, kind, name, target, on_report=None):
+        self.kind = kind
+        self.name = name
+        self.target = target
+        self.on_report = on_report
+        self.state = "running"
+        self.parsed = 0
+        self.inserted = 0
+        self.session_id = None
+        self.messages = []
+        self.begin = time()
+        self.end = None
+        self.reported = 0
+        self.cancel_event = Event()
+
+    @property
+    def running(self):
+        return self.state == "running"
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def progress(self, parsed, inserted, session_id=None):
+        self.parsed = parsed
+        self.inserted = inserted
+        if session_id is not None:
+            self.session_id = session_id
+        if time() - self.reported >= self.REPORT_INTERVAL:
+            self.report()
+
+    def run(self):
+        try:
+            self.messages.extend(self.target(self))
+            self.state = "cancelled" if self.cancelled else "finished"
+        except Exception:
+            exception = traceback.format_exc()
+            logging.error(exception)
+            self.messages.append("Import failed:\n%s" % exception)
+            self.state = "failed"
+        finally:
+            self.end = time()
+            self.report()
+
+    def report(self):
+        self.reported = time()
+        if self.on_report:
+            self.on_report(self.status())
+
+    def status(self):
+        elapsed = (self.end or time()) - self.begin
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "state": self.state,
+            "parsed": self.parsed,
+            "inserted": self.inserted,
+            "rate": round(self.inserted / elapsed) if elapsed > 0 else 0,
+            "elapsed": round(elapsed, 1),
+            "session_id": self.session_id,
+            "messages": self.messages,
+        }
+
+
+class ImportManager:
+    """
+    Runs one import at a time in a worker thread, progress is emitted as "import-progress" via backend
+    """
+    backend = None
+    job = None
+    lock = Lock()
+
+    def start(self, kind, name, target):
+        with self.lock:
+            if ImportManager.job is not None and ImportManager.job.running:
+                return None
+
+            job = ImportManager.job = ImportJob(kind, name, target, self.emit)
+
+        Thread(target=job.run, name="import", daemon=True).start()
+        return job
+
+    def cancel(self):
+        job = ImportManager.job
+        if job is not None and job.running:
+            job.cancel()
+            return True
+        return False
+
+    def running(self):
+        job = ImportManager.job
+        return job is not None and job.running
+
+    def collect(self, kind):
+        """
+        Status of the current job of given kind, finished job is forgotten once collected
+        """
+        with self.lock:
+            job = ImportManager.job
+            if job is None or job.kind != kind:
+                return None
+
+            if not job.running:
+                ImportManager.job = None
+
+            return job.status()
+
+    def emit(self, status):
+        if self.backend is not None:
+            self.backend.emit("import-progress", json.dumps(status))